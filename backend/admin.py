@@ -1,3 +1,4 @@
+from django import forms
 from django.contrib import admin
 
 admin.site.site_header = "CoinDCX Admin"
@@ -5,9 +6,11 @@ admin.site.site_title = "Crypto Trading Platform"
 admin.site.index_title = "Welcome to CoinDCX Admin Panel"
 
 # Register your models here.
+from . import orders
+from .ledger import InsufficientBalance
 from .models import (
     CustomUser, Currency, Balance, WalletTransaction,
-    Order, Trade, LastTradedPrice, Charge
+    Order, OrderArchive, Trade, LastTradedPrice, Charge, TradingPair, UserTrade
 )
 
 @admin.register(CustomUser)
@@ -26,17 +29,52 @@ class CurrencyAdmin(admin.ModelAdmin):
     def has_module_permission(self, request):
         return request.user.is_superuser
     
+@admin.register(TradingPair)
+class TradingPairAdmin(admin.ModelAdmin):
+    list_display = ('id', 'base_currency', 'quote_currency', 'tick_size', 'lot_size', 'min_notional', 'active')
+    list_filter = ('active',)
+    list_select_related = ('base_currency', 'quote_currency')
+
+    def has_module_permission(self, request):
+        return request.user.is_superuser
+
 @admin.register(WalletTransaction)
 class WalletTransactionAdmin(admin.ModelAdmin):
     list_display = ('user', 'type', 'currency', 'amount', 'status', 'created_at')
+    list_select_related = ('user', 'currency')
     list_filter = ('type', 'status', 'currency')
     search_fields = ('user__email',)
     def has_module_permission(self, request):
         return request.user.is_staff
     
+class OrderForm(forms.ModelForm):
+    user = None  # set per request by OrderAdmin.get_form
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.instance.pk is None and not self.errors:
+            order = Order(
+                user=self.user,
+                type=cleaned_data.get('type'),
+                execution_type=cleaned_data.get('execution_type'),
+                base_currency=cleaned_data.get('base_currency'),
+                quote_currency=cleaned_data.get('quote_currency'),
+                price=cleaned_data.get('price'),
+                quantity=cleaned_data.get('quantity'),
+                remaining_quantity=cleaned_data.get('quantity'),
+            )
+            try:
+                orders.validate([order])
+            except (orders.InvalidOrder, InsufficientBalance) as e:
+                raise forms.ValidationError(str(e))
+        return cleaned_data
+
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderForm
     list_display = ('id', 'user', 'type', 'base_currency', 'quote_currency', 'price', 'quantity', 'remaining_quantity', 'status')
+    list_select_related = ('user', 'base_currency', 'quote_currency')
     exclude = ('user',)  # ✅ Hide user field from the form
+    actions = ['cancel_orders']
 
     def save_model(self, request, obj, form, change):
         if not change or not obj.user_id:
@@ -55,11 +93,14 @@ class OrderAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not change or not obj.user_id:
             obj.user = request.user
+        if not change:
+            obj.remaining_quantity = obj.quantity
         obj.save()
 
     # 3. Prevent users from seeing or editing `user` field
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
+        form.user = request.user
         if not request.user.is_superuser:
             if 'user' in form.base_fields:
                 form.base_fields['user'].disabled = True
@@ -72,16 +113,25 @@ class OrderAdmin(admin.ModelAdmin):
         return readonly
 
     # 5. Control add/change/delete permissions
+    # A placed order belongs to the matcher: editing or deleting its row would
+    # bypass the book and strand its locked funds. Open orders are cancelled
+    # with the action below, so only the changelist is left writable.
     def has_change_permission(self, request, obj=None):
-        return obj is None or obj.user == request.user
+        return obj is None
 
     def has_delete_permission(self, request, obj=None):
-        return obj is None or obj.user == request.user
+        return False
 
     def has_add_permission(self, request):
         return request.user.is_staff and not request.user.is_superuser
 
-    # 6. Optional: Limit trading to specific base/quote pairs
+    # 6. Cancel open orders through the matcher
+    @admin.action(description="Cancel selected orders")
+    def cancel_orders(self, request, queryset):
+        cancelled = orders.cancel(request.user, order_ids=list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f"Cancelling {len(cancelled)} open order(s).")
+
+    # 7. Optional: Limit trading to specific base/quote pairs
     # def formfield_for_foreignkey(self, db_field, request, **kwargs):
     #     if db_field.name == "base_currency":
     #         kwargs["queryset"] = Currency.objects.filter(symbol__in=["BTC", "ETH"])
@@ -91,13 +141,32 @@ class OrderAdmin(admin.ModelAdmin):
 
 admin.site.register(Order, OrderAdmin)
 
+# ---------------- Order Archive Admin ----------------
+class OrderArchiveAdmin(admin.ModelAdmin):
+    list_display = ('id', 'type', 'base_currency', 'quote_currency', 'price', 'quantity', 'remaining_quantity', 'status', 'created_at')
+    list_select_related = ('base_currency', 'quote_currency')
+    def get_queryset(self, request):
+        if request.user.is_superuser:
+            return OrderArchive.objects.none()
+        return OrderArchive.objects.filter(user=request.user)
+    def has_module_permission(self, request):
+        return not request.user.is_superuser
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
+
+admin.site.register(OrderArchive, OrderArchiveAdmin)
+
 # ---------------- Trade Admin ----------------
 class TradeAdmin(admin.ModelAdmin):
     list_display = ('id', 'buyer', 'seller', 'base_currency', 'quote_currency', 'price', 'quantity', 'traded_at')
+    list_select_related = ('buyer', 'seller', 'base_currency', 'quote_currency')
+    ordering = ('-traded_at', '-id')
     def get_queryset(self, request):
         if request.user.is_superuser:
             return Trade.objects.none()
-        return Trade.objects.filter(buyer=request.user) | Trade.objects.filter(seller=request.user)
+        # The user's side rows instead of an OR across buyer and seller.
+        return Trade.objects.filter(id__in=UserTrade.objects.filter(user=request.user).values('trade_id'))
     def has_module_permission(self, request):
         return not request.user.is_superuser
     def has_add_permission(self, request): return False
@@ -109,6 +178,7 @@ admin.site.register(Trade, TradeAdmin)
 # ---------------- LTP Admin ----------------
 class LTPAdmin(admin.ModelAdmin):
     list_display = ('id', 'base_currency', 'quote_currency', 'price', 'updated_at')
+    list_select_related = ('base_currency', 'quote_currency')
     def has_module_permission(self, request):
         return not request.user.is_superuser
     def has_add_permission(self, request): return False
@@ -120,6 +190,7 @@ admin.site.register(LastTradedPrice, LTPAdmin)
 # ---------------- Charges Admin ----------------
 class ChargesAdmin(admin.ModelAdmin):
     list_display = ('base_currency', 'quote_currency', 'maker_fee', 'taker_fee')
+    list_select_related = ('base_currency', 'quote_currency')
     def get_queryset(self, request):
         return Charge.objects.none() if request.user.is_superuser else super().get_queryset(request)
     def has_module_permission(self, request):
@@ -132,7 +203,8 @@ admin.site.register(Charge, ChargesAdmin)
 
 # ---------------- Balance Admin ----------------
 class BalanceAdmin(admin.ModelAdmin):
-    list_display = ('user', 'currency', 'amount')
+    list_display = ('user', 'currency', 'available', 'locked')
+    list_select_related = ('user', 'currency')
     def get_queryset(self, request):
         return Balance.objects.filter(user=request.user) if not request.user.is_superuser else Balance.objects.none()
     def has_module_permission(self, request):
@@ -0,0 +1,284 @@
+"""
+Matching benchmark: seeded synthetic order flow replayed against the
+current engine or against a copy of the original nested-loop matcher.
+
+Run it with `manage.py bench_matching`. Both engines see the same flow;
+the baseline has no market orders, so it places them as limit orders at
+their protection price.
+"""
+import random
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import orders as order_service
+from .engine import OPEN_STATUSES, engine
+from .ledger import InsufficientBalance
+from .matcher import MatcherWorker
+from .models import Balance, Charge, Currency, CustomUser, LastTradedPrice, Order, Trade
+
+Action = namedtuple('Action', 'kind pair user side price quantity target')
+Report = namedtuple('Report', 'engine orders rejected seconds orders_per_second p50_ms p99_ms queries_per_order trades')
+
+PLACE, MARKET, CANCEL = 'place', 'market', 'cancel'
+MID_PRICE = 10000
+BALANCE = Decimal('1000000000')
+
+
+def synthetic_flow(seed=1, orders=1000, pairs=1, depth=50, market_ratio=0.1, cancel_ratio=0.2, users=10):
+    """
+    A reproducible list of Actions: `depth` resting levels per side and pair,
+    then `orders` actions that cancel an earlier order, send a market order
+    or place a limit order up to `depth` ticks either side of the mid.
+    `target` of a cancel is the index of the action that placed the order.
+    """
+    rng = random.Random(seed)
+    flow = []
+    placed = [[] for _ in range(users)]
+
+    def place(action):
+        placed[action.user].append(len(flow))
+        flow.append(action)
+
+    for pair in range(pairs):
+        for level in range(1, depth + 1):
+            place(Action(PLACE, pair, rng.randrange(users), 'buy', MID_PRICE - level, _quantity(rng), None))
+            place(Action(PLACE, pair, rng.randrange(users), 'sell', MID_PRICE + level, _quantity(rng), None))
+    for _ in range(orders):
+        pair, user, side = rng.randrange(pairs), rng.randrange(users), rng.choice(['buy', 'sell'])
+        roll = rng.random()
+        if roll < cancel_ratio and placed[user]:
+            flow.append(Action(CANCEL, None, user, None, None, None, rng.choice(placed[user])))
+        elif roll < cancel_ratio + market_ratio:
+            # Protection price: far enough to sweep the whole seeded book.
+            price = MID_PRICE + 2 * depth if side == 'buy' else MID_PRICE - 2 * depth
+            flow.append(Action(MARKET, pair, user, side, price, _quantity(rng), None))
+        else:
+            place(Action(PLACE, pair, user, side, MID_PRICE + rng.randint(-depth, depth), _quantity(rng), None))
+    return flow
+
+
+def _quantity(rng):
+    return Decimal(rng.randint(1, 1000)).scaleb(-2)
+
+
+def setup_market(pairs, users, prefix='BN'):
+    """Users with ample balances and `pairs` base currencies quoted in one quote currency."""
+    quote = Currency.objects.create(name='Bench quote', symbol=f'{prefix}Q', is_crypto=False)
+    bases = [Currency.objects.create(name=f'Bench base {i}', symbol=f'{prefix}{i}') for i in range(pairs)]
+    accounts = [CustomUser.objects.create(username=f'{prefix.lower()}-{i}', email=f'{prefix.lower()}-{i}@bench.invalid') for i in range(users)]
+    Balance.objects.filter(user__in=accounts).update(available=BALANCE)
+    return accounts, [(base.id, quote.id) for base in bases]
+
+
+def run(flow, baseline=False, pairs=None, users=None, prefix='BN'):
+    """Replay `flow` against a fresh market and return a Report."""
+    pairs = pairs if pairs is not None else max(action.pair for action in flow if action.pair is not None) + 1
+    users = users if users is not None else max(action.user for action in flow) + 1
+    accounts, pair_ids = setup_market(pairs, users, prefix)
+    engine.reset()
+    worker = MatcherWorker(pairs=pair_ids)
+    placed = {}
+    latencies = []
+    rejected = 0
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    step = _baseline_step if baseline else _current_step
+    started_at = time.perf_counter()
+    with connection.execute_wrapper(count):
+        for index, action in enumerate(flow):
+            action_started_at = time.perf_counter()
+            try:
+                order = step(action, accounts, pair_ids, placed, worker)
+            except (order_service.InvalidOrder, InsufficientBalance):
+                rejected += 1
+                continue
+            if order is not None:
+                placed[index] = order
+            latencies.append(time.perf_counter() - action_started_at)
+    seconds = time.perf_counter() - started_at
+    latencies.sort()
+    return Report(
+        engine='baseline' if baseline else 'current',
+        orders=len(latencies),
+        rejected=rejected,
+        seconds=seconds,
+        orders_per_second=len(latencies) / seconds if seconds else 0.0,
+        p50_ms=_percentile(latencies, 50) * 1000,
+        p99_ms=_percentile(latencies, 99) * 1000,
+        queries_per_order=queries[0] / len(latencies) if latencies else 0.0,
+        trades=Trade.objects.filter(base_currency_id__in=[base for base, _ in pair_ids]).count(),
+    )
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def _new_order(action, accounts, pair_ids):
+    base_id, quote_id = pair_ids[action.pair]
+    return Order(
+        user=accounts[action.user],
+        type=action.side,
+        execution_type=Order.ExecutionType.MARKET if action.kind == MARKET else Order.ExecutionType.LIMIT,
+        base_currency_id=base_id,
+        quote_currency_id=quote_id,
+        price=Decimal(action.price),
+        quantity=action.quantity,
+        remaining_quantity=action.quantity,
+    )
+
+
+def _current_step(action, accounts, pair_ids, placed, worker):
+    if action.kind == CANCEL:
+        target = placed.get(action.target)
+        if target is not None:
+            with transaction.atomic():
+                order_service.cancel_orders(accounts[action.user], order_ids=[target.id])
+            worker.run_once()
+        return None
+    order = _new_order(action, accounts, pair_ids)
+    with transaction.atomic():
+        order_service.place_orders([order])
+    worker.run_once()
+    return order
+
+
+def _baseline_step(action, accounts, pair_ids, placed, worker):
+    if action.kind == CANCEL:
+        target = placed.get(action.target)
+        if target is not None:
+            target.refresh_from_db()
+            if target.status in OPEN_STATUSES:
+                legacy_release_locked_funds(target)
+        return None
+    order = _new_order(action, accounts, pair_ids)
+    order.execution_type = Order.ExecutionType.LIMIT
+    # bulk_create() skips the post_save handler of the current engine.
+    Order.objects.bulk_create([order])
+    legacy_lock_funds(order)
+    legacy_match_orders()
+    return order
+
+
+# --- Baseline ---
+# The matcher this project started with, kept for comparison. Only field
+# names and status values are brought up to date with the current schema.
+
+def legacy_lock_funds(order):
+    """Lock funds when an order is created."""
+    if order.type == Order.OrderType.BUY:
+        total_cost = order.price * order.quantity
+        _legacy_lock_user_balance(order.user, order.quote_currency, total_cost)
+        order.locked_funds = total_cost
+    elif order.type == Order.OrderType.SELL:
+        _legacy_lock_user_balance(order.user, order.base_currency, order.quantity)
+        order.locked_funds = order.quantity
+
+    order.save(update_fields=['locked_funds'])
+
+
+def _legacy_lock_user_balance(user, currency, amount):
+    balance, _ = Balance.objects.get_or_create(user=user, currency=currency)
+    if balance.available < amount:
+        raise InsufficientBalance("Insufficient balance to place order.")
+    balance.available -= amount
+    balance.save(update_fields=['available'])
+
+
+@transaction.atomic
+def legacy_match_orders():
+    buy_orders = Order.objects.select_for_update().filter(type='buy', status__in=OPEN_STATUSES).order_by('-price', 'created_at')
+    sell_orders = Order.objects.select_for_update().filter(type='sell', status__in=OPEN_STATUSES).order_by('price', 'created_at')
+
+    for buy in buy_orders:
+        for sell in sell_orders:
+            if (
+                buy.base_currency != sell.base_currency or
+                buy.quote_currency != sell.quote_currency or
+                buy.price < sell.price or
+                buy.remaining_quantity <= 0 or
+                sell.remaining_quantity <= 0
+            ):
+                continue
+
+            match_qty = min(buy.remaining_quantity, sell.remaining_quantity)
+            trade_price = sell.price
+            total_trade_value = trade_price * match_qty
+
+            maker_fee = taker_fee = Decimal(0)
+            try:
+                charge = Charge.objects.get(base_currency=buy.base_currency, quote_currency=buy.quote_currency, active=True)
+                maker_fee = charge.maker_fee / 100
+                taker_fee = charge.taker_fee / 100
+            except Charge.DoesNotExist:
+                pass
+
+            fee_seller = total_trade_value * maker_fee
+            fee_buyer = total_trade_value * taker_fee
+
+            _legacy_update_balance(sell.user, sell.quote_currency, total_trade_value - fee_seller)
+            _legacy_update_balance(buy.user, buy.base_currency, match_qty)
+
+            buy.locked_funds -= (total_trade_value + fee_buyer)
+            sell.locked_funds -= match_qty
+            buy.save(update_fields=['locked_funds'])
+            sell.save(update_fields=['locked_funds'])
+
+            buy.remaining_quantity -= match_qty
+            sell.remaining_quantity -= match_qty
+
+            buy.status = 'partial' if buy.remaining_quantity > 0 else 'executed'
+            sell.status = 'partial' if sell.remaining_quantity > 0 else 'executed'
+
+            buy.save(update_fields=['remaining_quantity', 'status'])
+            sell.save(update_fields=['remaining_quantity', 'status'])
+
+            Trade.objects.create(
+                buy_order=buy,
+                sell_order=sell,
+                buyer=buy.user,
+                seller=sell.user,
+                base_currency=buy.base_currency,
+                quote_currency=buy.quote_currency,
+                price=trade_price,
+                quantity=match_qty,
+                fee_buyer=fee_buyer,
+                fee_seller=fee_seller,
+                traded_at=timezone.now()
+            )
+
+            LastTradedPrice.objects.update_or_create(
+                base_currency=buy.base_currency,
+                quote_currency=buy.quote_currency,
+                defaults={'price': trade_price, 'updated_at': timezone.now()}
+            )
+
+            if buy.remaining_quantity == 0:
+                break
+
+
+def _legacy_update_balance(user, currency, amount):
+    balance, _ = Balance.objects.get_or_create(user=user, currency=currency)
+    balance.available += amount
+    balance.save(update_fields=['available'])
+
+
+def legacy_release_locked_funds(order):
+    if order.locked_funds > 0:
+        if order.type == 'buy':
+            _legacy_update_balance(order.user, order.quote_currency, order.locked_funds)
+        elif order.type == 'sell':
+            _legacy_update_balance(order.user, order.base_currency, order.locked_funds)
+        order.locked_funds = Decimal(0)
+        order.status = 'cancelled'
+        order.save(update_fields=['locked_funds', 'status'])
@@ -0,0 +1,99 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Q
+
+from .fixedpoint import mul, to_decimal, to_units
+from .models import Candle
+
+INTERVALS = {
+    Candle.Interval.ONE_MINUTE: timedelta(minutes=1),
+    Candle.Interval.FIVE_MINUTES: timedelta(minutes=5),
+    Candle.Interval.ONE_HOUR: timedelta(hours=1),
+    Candle.Interval.ONE_DAY: timedelta(days=1),
+}
+
+CANDLE_FIELDS = ['open', 'high', 'low', 'close', 'volume', 'quote_volume', 'trades']
+
+
+def open_time(timestamp, interval):
+    """Start of the `interval` bucket that `timestamp` falls into."""
+    epoch = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    step = INTERVALS[interval]
+    return epoch + ((timestamp - epoch) // step) * step
+
+
+def aggregate(trades, bars=None):
+    """
+    Fold trades, oldest first, into {(base_id, quote_id, interval, open_time): Candle}.
+    Passing the result back in as `bars` keeps accumulating into it.
+    """
+    bars = {} if bars is None else bars
+    for trade in trades:
+        notional = to_decimal(mul(to_units(trade.price), to_units(trade.quantity)))
+        for interval in INTERVALS:
+            key = (trade.base_currency_id, trade.quote_currency_id, interval, open_time(trade.traded_at, interval))
+            bar = bars.get(key)
+            if bar is None:
+                bars[key] = Candle(
+                    base_currency_id=key[0], quote_currency_id=key[1], interval=interval, open_time=key[3],
+                    open=trade.price, high=trade.price, low=trade.price, close=trade.price,
+                    volume=trade.quantity, quote_volume=notional, trades=1,
+                )
+            else:
+                bar.high = max(bar.high, trade.price)
+                bar.low = min(bar.low, trade.price)
+                bar.close = trade.price
+                bar.volume += trade.quantity
+                bar.quote_volume += notional
+                bar.trades += 1
+    return bars
+
+
+def save(bars):
+    """
+    Merge freshly aggregated bars into the stored ones: one read for the
+    bars that already exist and one upsert. Only the pair's matcher writes
+    open buckets and the backfill only rewrites closed ones, so the
+    read-merge-write cannot race.
+    """
+    if not bars:
+        return
+    times = defaultdict(list)
+    for base_id, quote_id, interval, time in bars:
+        times[base_id, quote_id, interval].append(time)
+    keys = Q()
+    for (base_id, quote_id, interval), open_times in times.items():
+        keys |= Q(base_currency_id=base_id, quote_currency_id=quote_id, interval=interval, open_time__in=open_times)
+    for stored in Candle.objects.filter(keys):
+        bar = bars[stored.base_currency_id, stored.quote_currency_id, stored.interval, stored.open_time]
+        bar.open = stored.open
+        bar.high = max(bar.high, stored.high)
+        bar.low = min(bar.low, stored.low)
+        bar.volume += stored.volume
+        bar.quote_volume += stored.quote_volume
+        bar.trades += stored.trades
+    Candle.objects.bulk_create(
+        bars.values(),
+        update_conflicts=True,
+        unique_fields=['base_currency', 'quote_currency', 'interval', 'open_time'],
+        update_fields=CANDLE_FIELDS,
+    )
+
+
+def record_trades(trades):
+    """Roll a matching pass' new trades into every candle interval."""
+    save(aggregate(trades))
+
+
+def candle_range(base_currency_id, quote_currency_id, interval, start=None, end=None, limit=500):
+    """Bars of one pair and interval with open_time in [start, end), oldest first."""
+    candles = Candle.objects.filter(base_currency_id=base_currency_id, quote_currency_id=quote_currency_id, interval=interval)
+    if start is not None:
+        candles = candles.filter(open_time__gte=start)
+    if end is not None:
+        candles = candles.filter(open_time__lt=end)
+    if start is None:
+        # Without a start, return the latest `limit` bars.
+        return reversed(candles.order_by('-open_time')[:limit])
+    return candles.order_by('open_time')[:limit]
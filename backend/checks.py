@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends whose entries never leave the process that wrote them.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache_errors():
+    """The fee and pair version stamps and the market data only reach the run_matcher worker through the cache."""
+    if settings.MATCHER_INLINE or settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        "MATCHER_INLINE is off, so the web and run_matcher processes need a shared cache.",
+        hint="Set CACHE_BACKEND and CACHE_LOCATION, e.g. django.core.cache.backends.redis.RedisCache "
+             "and redis://localhost:6379/0, or set MATCHER_INLINE=1 for a single web process.",
+        id='backend.E001',
+    )]
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    return shared_cache_errors()
@@ -1,86 +1,316 @@
-from .models import Order, Trade, Balance, LastTradedPrice, Charge
-from django.db import transaction
-from decimal import Decimal
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 
-@transaction.atomic
-def match_orders():
-    # Match BUY orders with SELL orders
-    buy_orders = Order.objects.filter(type='BUY', status__in=['PENDING', 'PARTIAL']).order_by('-price', 'created_at')
-    sell_orders = Order.objects.filter(type='SELL', status__in=['PENDING', 'PARTIAL']).order_by('price', 'created_at')
+from . import fees, marketdata, metrics, pairs, ticker
+from .fixedpoint import SCALE, mul, to_units
+from .journal import Journal
+from .models import LastTradedPrice, Order, OrderEvent
+from .orderbook import BookOrder, OrderBook
+from .settlement import Settlement
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = (Order.OrderStatus.PENDING, Order.OrderStatus.PARTIAL)
+
+
+def resting_orders(base_currency_id, quote_currency_id):
+    """
+    The orders resting in a pair's book, per side in price-time order.
+    Orders still waiting in the queue are left for the matcher to process.
+    """
+    queued = OrderEvent.objects.filter(order=OuterRef('pk'), type=OrderEvent.EventType.PLACE, processed_at=None)
+    return (
+        Order.objects.filter(
+            base_currency_id=base_currency_id,
+            quote_currency_id=quote_currency_id,
+            status__in=OPEN_STATUSES,
+        )
+        .exclude(price=None)
+        .exclude(Exists(queued))
+        .order_by('type', 'price', 'created_at', 'id')
+    )
+
+
+class MatchingEngine:
+    """
+    Keeps one in-memory OrderBook per base/quote pair and matches orders
+    against it with price-time priority. A pair's book is rebuilt the first
+    time the engine touches that pair: from its journal, if one is kept,
+    otherwise from the Order table.
+    """
+
+    # Longest a committed LTP waits in memory before it is written back.
+    LTP_FLUSH_INTERVAL = 1.0
 
-    for buy in buy_orders:
-        for sell in sell_orders:
-            if buy.base_currency != sell.base_currency or buy.quote_currency != sell.quote_currency:
-                continue
+    def __init__(self):
+        self.books = {}
+        self.settlement = None
+        self.lock = threading.RLock()
+        self.last_prices = {}
+        self.last_prices_flushed_at = time.monotonic()
+        self.flush_timer = None
+        self.journal = None
+        if settings.MATCHER_JOURNAL_DIR:
+            self.journal = Journal(settings.MATCHER_JOURNAL_DIR, settings.MATCHER_SNAPSHOT_INTERVAL)
 
-            if buy.price < sell.price:
-                continue  # Price mismatch
+    def book(self, base_currency_id, quote_currency_id):
+        key = (base_currency_id, quote_currency_id)
+        book = self.books.get(key)
+        if book is None:
+            book = self.books[key] = OrderBook(base_currency_id, quote_currency_id)
+            # Carry on from the last published view so its readers see a newer sequence.
+            book.sequence = marketdata.last_sequence(base_currency_id, quote_currency_id) + 1
+            with metrics.phase('book_load'):
+                if self.journal is None or not self.journal.load(book):
+                    self._load(book)
+                    if self.journal is not None:
+                        # Start the pair's journal from what the table holds now.
+                        self.journal.snapshot(book)
+                ticker.warm(base_currency_id, quote_currency_id)
+        return book
 
-            match_qty = min(buy.remaining_quantity, sell.remaining_quantity)
-            if match_qty <= 0:
-                continue
+    def reset(self):
+        self.books = {}
+        if self.journal is not None:
+            self.journal.close()
 
-            trade_price = sell.price
-            total_trade_value = trade_price * match_qty
+    def _load(self, book):
+        """Rebuild `book` from the resting orders of its pair."""
+        for order in resting_orders(book.base_currency_id, book.quote_currency_id):
+            book.add(_book_order(order))
 
-            # Fetch charges
+    @contextmanager
+    def matching_pass(self):
+        """
+        Run a block of matching in one transaction. Fills are collected in
+        a Settlement and written in bulk when the block finishes.
+        """
+        waited_at = time.perf_counter()
+        with self.lock:
+            if self.settlement is not None:
+                yield
+                return
+            lock_wait = time.perf_counter() - waited_at
+            metrics.observe('matching_lock_wait_seconds', lock_wait)
+            self.settlement = Settlement()
             try:
-                charge = Charge.objects.get(base_currency=buy.base_currency, quote_currency=buy.quote_currency, active=True)
-                maker_fee = charge.maker_fee / 100  # convert to decimal percent
-                taker_fee = charge.taker_fee / 100
-            except Charge.DoesNotExist:
-                maker_fee = taker_fee = Decimal(0)
-
-            # Assume SELL is maker, BUY is taker
-            fee_seller = trade_price * match_qty * maker_fee
-            fee_buyer = trade_price * match_qty * taker_fee
-
-            # Update balances
-            _update_balance(sell.user, sell.base_currency, -match_qty)  # seller gives BTC
-            _update_balance(sell.user, sell.quote_currency, total_trade_value - fee_seller)  # seller gets INR
-
-            _update_balance(buy.user, buy.base_currency, match_qty)  # buyer receives BTC
-            _update_balance(buy.user, buy.quote_currency, -(total_trade_value + fee_buyer))  # buyer pays INR
-
-            # Update remaining quantities
-            buy.remaining_quantity -= match_qty
-            sell.remaining_quantity -= match_qty
-
-            buy.status = 'PARTIAL' if buy.remaining_quantity > 0 else 'FILLED'
-            sell.status = 'PARTIAL' if sell.remaining_quantity > 0 else 'FILLED'
-
-            buy.save(update_fields=['remaining_quantity', 'status'])
-            sell.save(update_fields=['remaining_quantity', 'status'])
-
-            # Create Trade
-            Trade.objects.create(
-                buy_order=buy,
-                sell_order=sell,
-                buyer=buy.user,
-                seller=sell.user,
-                base_currency=buy.base_currency,
-                quote_currency=buy.quote_currency,
-                price=trade_price,
-                quantity=match_qty,
-                fee_buyer=fee_buyer,
-                fee_seller=fee_seller,
-                traded_at=timezone.now()
-            )
-
-            # Update LTP
-            LastTradedPrice.objects.update_or_create(
-                base_currency=buy.base_currency,
-                quote_currency=buy.quote_currency,
-                defaults={'price': trade_price, 'updated_at': timezone.now()}
-            )
-
-            if buy.remaining_quantity == 0:
-                break  # move to next buy order
-
-
-def _update_balance(user, currency, amount):
-    from .models import Balance
-    obj, created = Balance.objects.get_or_create(user=user, currency=currency)
-    obj.amount += Decimal(amount)
-    obj.save(update_fields=['amount'])
+                with metrics.matching_pass(), transaction.atomic():
+                    metrics.record(lock_wait_ms=round(lock_wait * 1000, 3))
+                    yield
+                    with metrics.phase('flush'):
+                        self.settlement.flush()
+                    metrics.record(fills=len(self.settlement.trades))
+                    if self.journal is not None:
+                        with metrics.phase('journal'):
+                            self.journal.write()
+                        transaction.on_commit(partial(self.journal.committed, self.settlement.books))
+                    transaction.on_commit(partial(self.publish, self.settlement.books, self.settlement.trades))
+            except Exception:
+                # The database rolled back, so the books can no longer be trusted.
+                if self.journal is not None:
+                    self.journal.rollback()
+                self.reset()
+                raise
+            finally:
+                self.settlement = None
+
+    def publish(self, books, trades=()):
+        """Push the committed state of `books` and their new trades to the market data cache."""
+        with metrics.phase('publish'):
+            self._publish(books, trades)
+
+    def _publish(self, books, trades):
+        ticker.record(trades)
+        trades_by_pair = defaultdict(list)
+        for trade in trades:
+            trades_by_pair[trade.base_currency_id, trade.quote_currency_id].append(trade)
+        for book in books:
+            pair = pairs.pair_symbol(book.base_currency_id, book.quote_currency_id)
+            pair_trades = trades_by_pair[book.base_currency_id, book.quote_currency_id]
+            messages = [marketdata.trade_message(pair, trade) for trade in pair_trades]
+            if pair_trades:
+                last = pair_trades[-1]
+                self.last_prices[book.base_currency_id, book.quote_currency_id] = last.price
+                self._schedule_flush()
+                marketdata.publish_last_price(pair, last.price)
+                messages.append(marketdata.ltp_message(pair, last.price, last.traded_at))
+            messages.append(marketdata.publish_depth(book))
+            marketdata.publish_events(pair, messages)
+
+    def flush_last_prices(self, force=False):
+        """
+        Write back the LTPs that changed since the last flush, all pairs in
+        one upsert, at most once per LTP_FLUSH_INTERVAL unless forced.
+        """
+        with self.lock:
+            if not force and time.monotonic() - self.last_prices_flushed_at < self.LTP_FLUSH_INTERVAL:
+                return
+            self.last_prices_flushed_at = time.monotonic()
+            pending, self.last_prices = self.last_prices, {}
+            if not pending:
+                return
+            try:
+                LastTradedPrice.objects.bulk_create(
+                    [
+                        LastTradedPrice(base_currency_id=base_id, quote_currency_id=quote_id, price=price)
+                        for (base_id, quote_id), price in pending.items()
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['base_currency', 'quote_currency'],
+                    update_fields=['price', 'updated_at'],
+                )
+            except Exception:
+                # Keep them for the next flush, unless a newer price arrived meanwhile.
+                for key, price in pending.items():
+                    self.last_prices.setdefault(key, price)
+                raise
+
+    def _schedule_flush(self):
+        # Inline matching has no worker loop to flush with, and the next
+        # order may be a long way off: flush from a timer instead.
+        if not settings.MATCHER_INLINE:
+            return
+        with self.lock:
+            if self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.LTP_FLUSH_INTERVAL, self._flush_on_timer)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def _flush_on_timer(self):
+        with self.lock:
+            self.flush_timer = None
+        try:
+            self.flush_last_prices(force=True)
+        except Exception:
+            logger.exception('Could not write back the last traded prices')
+            self._schedule_flush()
+        finally:
+            # The timer thread's own connection.
+            connection.close()
+
+    def warm(self, base_currency_id, quote_currency_id):
+        """Load a pair's book and publish it, e.g. when a worker takes the pair over."""
+        with self.lock:
+            self.publish([self.book(base_currency_id, quote_currency_id)])
+
+    def match_orders(self):
+        """Match every queued order, across all pairs."""
+        with self.matching_pass():
+            self.process_events(OrderEvent.objects.select_related('order').filter(processed_at=None, failed_at=None).order_by('id'))
+
+    def process_events(self, events):
+        """Apply queued OrderEvents in the given order and mark them processed."""
+        with self.matching_pass():
+            with metrics.phase('dequeue'):
+                events = list(events)
+            metrics.record(events=len(events))
+            for event in events:
+                if self.journal is not None:
+                    self.journal.event(self.book(event.base_currency_id, event.quote_currency_id), event.id)
+                if event.type == OrderEvent.EventType.PLACE:
+                    self._match_incoming(event.order)
+                elif event.type == OrderEvent.EventType.CANCEL:
+                    self._cancel(event)
+            OrderEvent.objects.filter(id__in=[event.id for event in events]).update(processed_at=timezone.now())
+        return len(events)
+
+    def park(self, event, error):
+        """
+        Take an event the matcher cannot apply out of the queue. A parked
+        PLACE also cancels its order, if still open, to release its funds.
+        """
+        with self.lock, transaction.atomic():
+            OrderEvent.objects.filter(id=event.id).update(failed_at=timezone.now(), error=error)
+            if event.type != OrderEvent.EventType.PLACE or event.order.status not in OPEN_STATUSES:
+                return
+            try:
+                with transaction.atomic():
+                    settlement = Settlement()
+                    settlement.cancel_remainder(OrderBook(event.base_currency_id, event.quote_currency_id), _book_order(event.order))
+                    settlement.flush()
+            except Exception:
+                # The order stays out of the book, its funds locked, until someone looks at it.
+                logger.exception('Could not cancel order %s of parked event %s', event.order_id, event.id)
+
+    def _match_incoming(self, order):
+        book = self.book(order.base_currency_id, order.quote_currency_id)
+        self.settlement.books.add(book)
+        taker = _book_order(order)
+        budget = None
+        if order.execution_type == Order.ExecutionType.MARKET and taker.is_buy:
+            taker_fee = fees.fees_for(book.base_currency_id, book.quote_currency_id)[1]
+            pair = pairs.get(book.base_currency_id, book.quote_currency_id)
+            budget = QuoteBudget(taker.locked, taker_fee, pair.lot_size if pair else 1)
+        if self.journal is not None:
+            self.journal.accept(book, taker, order.execution_type == Order.ExecutionType.MARKET)
+        for fill in book.match(taker, budget):
+            self.settlement.add_fill(book, fill)
+            if self.journal is not None:
+                self.journal.fill(book, fill)
+        if taker.remaining <= 0:
+            return
+        if order.execution_type == Order.ExecutionType.MARKET:
+            # Market orders never rest: whatever liquidity could not fill is cancelled.
+            self.settlement.cancel_remainder(book, taker)
+            if self.journal is not None:
+                self.journal.cancel(book, taker.id)
+        else:
+            book.add(taker)
+            if self.journal is not None:
+                self.journal.rest(book, taker)
+
+    def _cancel(self, event):
+        book = self.book(event.base_currency_id, event.quote_currency_id)
+        order = book.remove(event.order_id)
+        if order is None:
+            # Filled, cancelled or never rested by the time the request came in.
+            return
+        self.settlement.books.add(book)
+        self.settlement.cancel_remainder(book, order)
+        if self.journal is not None:
+            self.journal.cancel(book, order.id)
+
+
+class QuoteBudget:
+    """
+    The quote funds a market buy locked, spent level by level as it sweeps,
+    in whole lots of the pair.
+    """
+
+    def __init__(self, funds, fee_rate, lot_size=1):
+        self.funds = funds
+        self.fee_rate = fee_rate
+        self.lot_size = lot_size
+
+    def cost(self, price, quantity):
+        # Notional and fee are rounded separately, exactly as Settlement does.
+        return mul(price, quantity) + mul(price, quantity, self.fee_rate)
+
+    def affordable(self, price):
+        quantity = self.funds * SCALE * SCALE // (price * (SCALE + self.fee_rate))
+        quantity -= quantity % self.lot_size
+        while quantity > 0 and self.cost(price, quantity) > self.funds:
+            quantity -= self.lot_size
+        return quantity
+
+    def spend(self, price, quantity):
+        self.funds -= self.cost(price, quantity)
+
+
+def _book_order(order):
+    return BookOrder(
+        order.id, order.user_id, order.type, to_units(order.price),
+        to_units(order.remaining_quantity), to_units(order.locked_funds),
+    )
+
+
+engine = MatchingEngine()
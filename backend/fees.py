@@ -0,0 +1,31 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from .fixedpoint import to_units
+from .models import Charge
+from .versioned import VersionedValue
+
+ZERO_FEES = (0, 0)
+
+
+def _load():
+    return {
+        (charge.base_currency_id, charge.quote_currency_id): (to_units(charge.maker_fee / 100), to_units(charge.taker_fee / 100))
+        for charge in Charge.objects.using(DEFAULT_DB_ALIAS).filter(active=True)
+    }
+
+
+_schedule = VersionedValue('fees:version', _load, 'fee_refresh')
+
+
+def fees_for(base_currency_id, quote_currency_id):
+    """Return the (maker_fee, taker_fee) fractions charged on a pair, in 1e-8 units."""
+    return _schedule.get().get((base_currency_id, quote_currency_id), ZERO_FEES)
+
+
+def max_fee_rate(base_currency_id, quote_currency_id):
+    return max(fees_for(base_currency_id, quote_currency_id))
+
+
+def invalidate():
+    """Drop this process' schedule and tell every other process to do the same."""
+    _schedule.invalidate()
@@ -0,0 +1,65 @@
+"""
+Fixed-point arithmetic for the matching core.
+
+Prices, quantities, funds and fee rates are held as integers counting
+1e-8 units, the resolution of every DecimalField(decimal_places=8) in the
+ledger. Conversion to and from Decimal happens only at the persistence
+boundary.
+
+Rounding rule: a product (notional, fee) is computed exactly on the
+integers and rounded once to the nearest unit, ties to even - the same
+result as quantizing the exact Decimal product to 8 places with
+ROUND_HALF_EVEN. Every amount that is stored (trade notional, fee) is
+rounded on its own; balance changes are sums of those stored amounts so
+the ledger always reconciles with the Trade rows.
+
+Reservations round up instead, so the funds locked for an order cover a
+single fill of it exactly. Across several fills the separately rounded
+amounts can still add up to a unit or two more; the buyer's fee on the
+fill that would overrun the lock is reduced to what is left (see
+Settlement.add_fill).
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+
+DECIMAL_PLACES = 8
+SCALE = 10 ** DECIMAL_PLACES
+QUANTUM = Decimal(1).scaleb(-DECIMAL_PLACES)
+
+
+def to_units(value):
+    """Decimal -> integer units. Values finer than 1e-8 are rounded half-even."""
+    if value is None:
+        return None
+    return int(Decimal(value).quantize(QUANTUM, rounding=ROUND_HALF_EVEN).scaleb(DECIMAL_PLACES))
+
+
+def to_decimal(units):
+    """Integer units -> Decimal with exactly 8 decimal places."""
+    if units is None:
+        return None
+    return Decimal(units).scaleb(-DECIMAL_PLACES).quantize(QUANTUM)
+
+
+def mul(*factors):
+    """Product of unit values, rounded half-even back to units."""
+    product = 1
+    for factor in factors:
+        product *= factor
+    return round_div(product, SCALE ** (len(factors) - 1))
+
+
+def mul_up(*factors):
+    """Product of non-negative unit values, rounded up to units (for reservations)."""
+    product = 1
+    for factor in factors:
+        product *= factor
+    return -(-product // SCALE ** (len(factors) - 1))
+
+
+def round_div(numerator, denominator):
+    """numerator / denominator rounded half-even; denominator must be positive."""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice > denominator or (twice == denominator and quotient % 2):
+        quotient += 1
+    return quotient
@@ -0,0 +1,143 @@
+"""
+Per-user trade history, read with keyset pagination and exported as a stream.
+
+Settlement writes two UserTrade rows per Trade, one per participant, so a
+user's history is a range of the (user, traded_at, id) index. Pages
+continue from a cursor naming the last row seen rather than an OFFSET,
+which keeps deep pages as cheap as the first.
+"""
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+
+from .pairs import pair_symbol
+from .models import Order, UserTrade
+
+PAGE_LIMIT = 500
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FIELDS = ['trade_id', 'traded_at', 'pair', 'side', 'price', 'quantity', 'fee', 'order_id']
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def sides(trades):
+    """The buyer's and the seller's UserTrade rows of saved trades."""
+    rows = []
+    for trade in trades:
+        for side, user_id, order_id, fee in (
+            (Order.OrderType.BUY, trade.buyer_id, trade.buy_order_id, trade.fee_buyer),
+            (Order.OrderType.SELL, trade.seller_id, trade.sell_order_id, trade.fee_seller),
+        ):
+            if user_id is None:
+                continue
+            rows.append(UserTrade(
+                user_id=user_id,
+                trade_id=trade.id,
+                order_id=order_id,
+                side=side,
+                base_currency_id=trade.base_currency_id,
+                quote_currency_id=trade.quote_currency_id,
+                price=trade.price,
+                quantity=trade.quantity,
+                fee=fee,
+                traded_at=trade.traded_at,
+            ))
+    return rows
+
+
+def record_trades(trades):
+    UserTrade.objects.bulk_create(sides(trades))
+
+
+def history(user_id, pair=None, start=None, end=None):
+    """A user's trades, newest first, optionally within a pair and [start, end)."""
+    queryset = UserTrade.objects.filter(user_id=user_id)
+    if pair is not None:
+        queryset = queryset.filter(base_currency_id=pair[0], quote_currency_id=pair[1])
+    if start is not None:
+        queryset = queryset.filter(traded_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(traded_at__lt=end)
+    return queryset.order_by('-traded_at', '-id')
+
+
+def cursor(row):
+    return f"{(row.traded_at - EPOCH) // MICROSECOND}.{row.id}"
+
+
+def parse_cursor(value):
+    try:
+        microseconds, id = (int(part) for part in value.split('.'))
+    except ValueError:
+        raise ValueError(f"Invalid cursor '{value}'.")
+    return EPOCH + microseconds * MICROSECOND, id
+
+
+def page(queryset, after=None, limit=PAGE_LIMIT):
+    """
+    Up to `limit` rows of a newest-first history() queryset following the
+    cursor `after`, and the cursor of the next page (None on the last one).
+    """
+    if after is not None:
+        traded_at, id = parse_cursor(after)
+        queryset = queryset.filter(Q(traded_at__lt=traded_at) | Q(traded_at=traded_at, id__lt=id))
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], cursor(rows[limit - 1])
+
+
+def as_dict(row):
+    return {
+        'trade_id': row.trade_id,
+        'traded_at': row.traded_at.isoformat(),
+        'pair': pair_symbol(row.base_currency_id, row.quote_currency_id),
+        'side': row.side,
+        'price': str(row.price),
+        'quantity': str(row.quantity),
+        'fee': str(row.fee),
+        'order_id': row.order_id,
+    }
+
+
+class _Line:
+    """File-like target that hands back what csv.writer writes instead of keeping it."""
+
+    def write(self, value):
+        return value
+
+
+def export(queryset, format='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Lines of CSV (with a header) or NDJSON for every row of `queryset`,
+    fetched `chunk_size` at a time so memory stays flat however long the
+    history is.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format '{format}', expected one of {', '.join(FORMATS)}.")
+    rows = map(as_dict, queryset.iterator(chunk_size=chunk_size))
+    if format == 'ndjson':
+        for row in rows:
+            yield json.dumps(row) + '\n'
+        return
+    writer = csv.DictWriter(_Line(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+async def aexport(queryset, format='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    export() for an ASGI server, which buffers a synchronous stream whole.
+    Each chunk of lines is read in the sync thread and sent as one piece.
+    """
+    lines = export(queryset, format, chunk_size)
+    next_chunk = sync_to_async(lambda: ''.join(islice(lines, chunk_size)))
+    while chunk := await next_chunk():
+        yield chunk
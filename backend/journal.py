@@ -0,0 +1,294 @@
+"""
+Append-only binary journal of the matching engine, one directory per pair.
+
+Every matching pass appends one block per pair it touched: the orders it
+accepted, the fills (with each maker's state after the fill), the
+remainders that came to rest and the cancellations. Blocks are written
+before the pass' transaction commits and cut off again if it rolls back,
+so the journal never runs behind the database.
+
+Every MATCHER_SNAPSHOT_INTERVAL records the book is written out whole and a
+new journal segment is started. A restarting matcher loads the latest
+snapshot and replays the segments after it instead of querying the Order
+table. Older segments are kept as the audit trail.
+
+Layout of <MATCHER_JOURNAL_DIR>/<base_id>-<quote_id>/:
+    snapshot-<n>.bin   the book as of the start of segment n
+    journal-<n>.bin    blocks appended after that snapshot
+"""
+import os
+import struct
+import time
+import zlib
+
+from django.conf import settings
+
+from .models import JournalCommit
+from .orderbook import BookOrder
+
+BLOCK = struct.Struct('<4sqqII')  # magic, unix time in microseconds, last event id, payload length, crc32
+BLOCK_MAGIC = b'MJB1'
+SNAPSHOT = struct.Struct('<4sq')  # magic, order count
+SNAPSHOT_MAGIC = b'MJS1'
+ORDER = struct.Struct('<qqBqqq')  # id, user id, side, price, remaining, locked
+
+ACCEPT = b'a'
+FILL = b'f'
+REST = b'r'
+CANCEL = b'c'
+RECORDS = {
+    ACCEPT: struct.Struct('<qqBBqqq'),  # id, user id, side, market, price, quantity, locked
+    FILL: struct.Struct('<qqqqqq'),  # maker id, taker id, price, quantity, maker remaining, maker locked
+    REST: ORDER,
+    CANCEL: struct.Struct('<q'),  # order id
+}
+
+SIDES = ('buy', 'sell')
+# Market orders without a protection price.
+NO_PRICE = -1
+
+
+class CorruptJournal(Exception):
+    pass
+
+
+def _side(order):
+    return SIDES.index(order.side)
+
+
+def _price(price):
+    return NO_PRICE if price is None else price
+
+
+class PairJournal:
+    """The journal files of one pair and the block being built for the current pass."""
+
+    def __init__(self, root, base_currency_id, quote_currency_id):
+        self.base_currency_id = base_currency_id
+        self.quote_currency_id = quote_currency_id
+        self.path = os.path.join(root, f'{base_currency_id}-{quote_currency_id}')
+        os.makedirs(self.path, exist_ok=True)
+        self.segment = max(self._numbers('journal-'), default=0)
+        self.file = None
+        self.pending = []
+        self.last_event_id = 0
+        self.written_at = None
+        self.records = 0
+
+    def _numbers(self, prefix):
+        return [int(name[len(prefix):-4]) for name in os.listdir(self.path) if name.startswith(prefix) and name.endswith('.bin')]
+
+    def _file_name(self, prefix, number):
+        return os.path.join(self.path, f'{prefix}{number}.bin')
+
+    def _open(self):
+        if self.file is None:
+            self.file = open(self._file_name('journal-', self.segment), 'ab')
+        return self.file
+
+    def add(self, kind, *values):
+        self.pending.append(kind + RECORDS[kind].pack(*values))
+
+    def write(self):
+        """Append the pending records as one block; remembers where it started for rollback()."""
+        if not self.pending:
+            return
+        payload = b''.join(self.pending)
+        file = self._open()
+        self.written_at = file.seek(0, os.SEEK_END)
+        file.write(BLOCK.pack(BLOCK_MAGIC, time.time_ns() // 1000, self.last_event_id, len(payload), zlib.crc32(payload)))
+        file.write(payload)
+        file.flush()
+        if settings.MATCHER_JOURNAL_FSYNC:
+            os.fsync(file.fileno())
+        self.records += len(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        """Forget the pending records and cut off the block written for a pass that did not commit."""
+        self.pending = []
+        if self.written_at is not None:
+            self.file.truncate(self.written_at)
+            self.written_at = None
+
+    def committed(self):
+        self.written_at = None
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def snapshot(self, book):
+        """Write out `book` whole and start a new segment after it."""
+        segment = self.segment + 1
+        orders = list(book.orders.values())
+        temporary = self._file_name('snapshot-', segment) + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(SNAPSHOT.pack(SNAPSHOT_MAGIC, len(orders)))
+            for order in orders:
+                file.write(ORDER.pack(order.id, order.user_id, _side(order), order.price, order.remaining, order.locked))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self._file_name('snapshot-', segment))
+        self.close()
+        self.segment = segment
+        self.records = 0
+        # Only the newest snapshot is needed to recover; the segments stay as the audit log.
+        for number in self._numbers('snapshot-'):
+            if number < segment:
+                os.remove(self._file_name('snapshot-', number))
+
+    def load(self, book):
+        """
+        Rebuild `book` from the latest snapshot and the segments after it.
+        Returns False if the pair has no snapshot yet.
+        """
+        snapshots = self._numbers('snapshot-')
+        if not snapshots:
+            return False
+        start = max(snapshots)
+        with open(self._file_name('snapshot-', start), 'rb') as file:
+            data = file.read()
+        magic, count = SNAPSHOT.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or len(data) != SNAPSHOT.size + count * ORDER.size:
+            raise CorruptJournal(f"Bad snapshot {start} in {self.path}")
+        for id, user_id, side, price, remaining, locked in ORDER.iter_unpack(memoryview(data)[SNAPSHOT.size:]):
+            book.add(BookOrder(id, user_id, SIDES[side], price, remaining, locked))
+        segments = sorted(number for number in self._numbers('journal-') if number >= start)
+        self.records = 0
+        for number in segments:
+            self.records += self._replay(book, number, last=number == segments[-1])
+        self.segment = max(segments, default=start)
+        return True
+
+    def _replay(self, book, number, last):
+        with open(self._file_name('journal-', number), 'rb') as file:
+            data = file.read()
+        offset = records = 0
+        blocks = []
+        while offset < len(data):
+            if len(data) - offset < BLOCK.size:
+                break
+            magic, _, last_event_id, length, crc = BLOCK.unpack_from(data, offset)
+            payload = data[offset + BLOCK.size:offset + BLOCK.size + length]
+            if magic != BLOCK_MAGIC or len(payload) != length or zlib.crc32(payload) != crc:
+                break
+            blocks.append((offset, last_event_id, payload))
+            offset += BLOCK.size + length
+        if offset < len(data) and not last:
+            raise CorruptJournal(f"Torn block inside segment {number} of {self.path}")
+        if last and blocks and not self._block_committed(blocks[-1][1]):
+            # Written, but the process died before the pass committed.
+            offset = blocks.pop()[0]
+        if offset < len(data):
+            with open(self._file_name('journal-', number), 'r+b') as file:
+                file.truncate(offset)
+        for _, _, payload in blocks:
+            records += self._apply(book, payload)
+        return records
+
+    def _block_committed(self, last_event_id):
+        if not last_event_id:
+            return True
+        committed = (
+            JournalCommit.objects.filter(base_currency_id=self.base_currency_id, quote_currency_id=self.quote_currency_id)
+            .values_list('last_event_id', flat=True)
+            .first()
+        )
+        return committed is not None and committed >= last_event_id
+
+    def _apply(self, book, payload):
+        offset = records = 0
+        view = memoryview(payload)
+        while offset < len(payload):
+            kind = bytes(view[offset:offset + 1])
+            values = RECORDS[kind].unpack_from(view, offset + 1)
+            offset += 1 + RECORDS[kind].size
+            records += 1
+            if kind == FILL:
+                maker_id, _, _, _, remaining, locked = values
+                book.update(maker_id, remaining, locked)
+            elif kind == REST:
+                id, user_id, side, price, remaining, locked = values
+                book.add(BookOrder(id, user_id, SIDES[side], price, remaining, locked))
+            elif kind == CANCEL:
+                book.remove(values[0])
+        return records
+
+
+class Journal:
+    """The journals of every pair this matcher has loaded."""
+
+    def __init__(self, root, snapshot_interval):
+        self.root = root
+        self.snapshot_interval = snapshot_interval
+        self.pairs = {}
+
+    def pair(self, book):
+        key = (book.base_currency_id, book.quote_currency_id)
+        if key not in self.pairs:
+            self.pairs[key] = PairJournal(self.root, *key)
+        return self.pairs[key]
+
+    def load(self, book):
+        return self.pair(book).load(book)
+
+    def snapshot(self, book):
+        self.pair(book).snapshot(book)
+
+    def accept(self, book, order, market):
+        self.pair(book).add(
+            ACCEPT, order.id, order.user_id, _side(order), market, _price(order.price), order.remaining, order.locked,
+        )
+
+    def fill(self, book, fill):
+        maker = fill.maker
+        self.pair(book).add(FILL, maker.id, fill.taker.id, fill.price, fill.quantity, maker.remaining, maker.locked)
+
+    def rest(self, book, order):
+        self.pair(book).add(REST, order.id, order.user_id, _side(order), order.price, order.remaining, order.locked)
+
+    def cancel(self, book, order_id):
+        self.pair(book).add(CANCEL, order_id)
+
+    def event(self, book, event_id):
+        """Tag the pair's block with the newest queue event it applies, to check it committed on recovery."""
+        pair = self.pair(book)
+        pair.last_event_id = max(pair.last_event_id, event_id)
+
+    def write(self):
+        """
+        Append each pair's block and, in the pass' transaction, record the
+        newest event it applies: the queue's own rows are archived and pruned.
+        """
+        commits = [
+            JournalCommit(base_currency_id=pair.base_currency_id, quote_currency_id=pair.quote_currency_id, last_event_id=pair.last_event_id)
+            for pair in self.pairs.values() if pair.pending and pair.last_event_id
+        ]
+        for pair in self.pairs.values():
+            pair.write()
+        if commits:
+            JournalCommit.objects.bulk_create(
+                commits, update_conflicts=True, unique_fields=['base_currency', 'quote_currency'], update_fields=['last_event_id'],
+            )
+
+    def rollback(self):
+        for pair in self.pairs.values():
+            pair.rollback()
+            pair.last_event_id = 0
+
+    def committed(self, books):
+        for pair in self.pairs.values():
+            pair.committed()
+            pair.last_event_id = 0
+        for book in books:
+            pair = self.pair(book)
+            if pair.records >= self.snapshot_interval:
+                pair.snapshot(book)
+
+    def close(self):
+        """Close every pair's files; their books are read back from disk on next use."""
+        for pair in self.pairs.values():
+            pair.close()
+        self.pairs = {}
@@ -0,0 +1,87 @@
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Round
+
+from .fixedpoint import DECIMAL_PLACES
+from .models import Balance, Currency, CustomUser
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+def provision(users=None, currencies=None):
+    """
+    Create the zero Balance rows for every user/currency combination so the
+    matching hot path can update balances without get_or_create.
+    """
+    user_ids = [user.pk for user in users] if users is not None else CustomUser.objects.values_list('id', flat=True)
+    currency_ids = [currency.pk for currency in currencies] if currencies is not None else Currency.objects.values_list('id', flat=True)
+    currency_ids = list(currency_ids)
+    provision_keys((user_id, currency_id) for user_id in user_ids for currency_id in currency_ids)
+
+
+def provision_keys(keys):
+    Balance.objects.bulk_create(
+        [Balance(user_id=user_id, currency_id=currency_id) for user_id, currency_id in keys],
+        ignore_conflicts=True,
+    )
+
+
+# --- Reservations ---
+# Funds backing an open order move from `available` to `locked` when it is
+# placed, leave `locked` as it fills and go back to `available` if it is
+# cancelled. Balance.locked therefore always equals the locked_funds of the
+# user's open orders in that currency. Fills and cancellations are settled
+# in bulk by Settlement through apply_deltas().
+
+def reserve(user_id, currency_id, amount):
+    """
+    Move `amount` from available to locked. The funds check is part of the
+    UPDATE, so no row lock or read is needed; raises InsufficientBalance.
+    """
+    updated = Balance.objects.filter(user_id=user_id, currency_id=currency_id, available__gte=amount).update(
+        available=F('available') - amount, locked=F('locked') + amount
+    )
+    if not updated:
+        raise InsufficientBalance("Insufficient balance to place order.")
+
+
+def apply_deltas(available=None, locked=None):
+    """
+    Add {(user_id, currency_id): delta} maps to the available and locked
+    columns of every affected Balance in one UPDATE.
+    """
+    deltas = {
+        'available': {key: delta for key, delta in (available or {}).items() if delta},
+        'locked': {key: delta for key, delta in (locked or {}).items() if delta},
+    }
+    rows = deltas['available'].keys() | deltas['locked'].keys()
+    if not rows:
+        return
+    keys = Q()
+    for user_id, currency_id in rows:
+        keys |= Q(user_id=user_id, currency_id=currency_id)
+    # Round() is a no-op on exact numerics but keeps SQLite, which adds
+    # decimals as floats, from drifting a hair below zero.
+    changes = {
+        field: Round(
+            F(field) + Case(
+                *[When(user_id=user_id, currency_id=currency_id, then=Value(delta)) for (user_id, currency_id), delta in field_deltas.items()],
+                default=Value(0),
+                output_field=Balance._meta.get_field(field),
+            ),
+            DECIMAL_PLACES,
+        )
+        for field, field_deltas in deltas.items() if field_deltas
+    }
+    updated = Balance.objects.filter(keys).update(**changes)
+    if updated < len(rows):
+        # Cold path: some rows were never provisioned. Create them empty and
+        # apply only their deltas.
+        existing = set(Balance.objects.filter(keys).values_list('user_id', 'currency_id'))
+        missing = rows - existing
+        provision_keys(missing)
+        apply_deltas(
+            available={key: delta for key, delta in deltas['available'].items() if key in missing},
+            locked={key: delta for key, delta in deltas['locked'].items() if key in missing},
+        )
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from backend import candles
+from backend.models import Candle, Trade
+from backend.pairs import pair_ids
+
+# Trades this recent may still sit in a matching pass that has not committed.
+SETTLE_MARGIN = timedelta(minutes=1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild OHLCV candles from the Trade table. Buckets that are still open are left to the matcher, "
+        "which keeps updating them, so the backfill can run while it does."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pair', action='append', dest='pairs', metavar='BASE/QUOTE',
+            help="Only rebuild this pair (repeatable). By default every pair is rebuilt.",
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Trades aggregated per write.")
+
+    def handle(self, *args, **options):
+        # Per interval, the start of the bucket the matcher may still write to.
+        cutoff = timezone.now() - SETTLE_MARGIN
+        open_from = {interval: candles.open_time(cutoff, interval) for interval in candles.INTERVALS}
+        trades = (
+            Trade.objects.only('base_currency_id', 'quote_currency_id', 'price', 'quantity', 'traded_at')
+            .filter(traded_at__lt=max(open_from.values()))
+        )
+        stale = Candle.objects.filter(self._closed_filter(open_from))
+        if options['pairs']:
+            pairs = [self._resolve(pair) for pair in options['pairs']]
+            trades = trades.filter(self._pair_filter(pairs))
+            stale = stale.filter(self._pair_filter(pairs))
+
+        chunk_size = options['chunk_size']
+        count = 0
+        with transaction.atomic():
+            stale.delete()
+            bars = {}
+            for count, trade in enumerate(
+                trades.order_by('base_currency_id', 'quote_currency_id', 'traded_at', 'id').iterator(chunk_size=chunk_size), 1
+            ):
+                candles.aggregate([trade], bars)
+                if count % chunk_size == 0:
+                    # A bar split across chunks is merged with its stored half.
+                    candles.save(self._closed(bars, open_from))
+                    bars = {}
+            candles.save(self._closed(bars, open_from))
+        self.stdout.write(f"Aggregated {count} trades into candles.")
+
+    def _closed(self, bars, open_from):
+        return {key: bar for key, bar in bars.items() if key[3] < open_from[key[2]]}
+
+    def _closed_filter(self, open_from):
+        condition = Q()
+        for interval, open_time in open_from.items():
+            condition |= Q(interval=interval, open_time__lt=open_time)
+        return condition
+
+    def _pair_filter(self, pairs):
+        condition = Q()
+        for base_id, quote_id in pairs:
+            condition |= Q(base_currency_id=base_id, quote_currency_id=quote_id)
+        return condition
+
+    def _resolve(self, pair):
+        ids = pair_ids(pair.replace('/', '-'))
+        if ids is None:
+            raise CommandError(f"Unknown pair '{pair}', expected BASE/QUOTE.")
+        return ids
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from backend import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay seeded synthetic order flow against the matching engine and report throughput, "
+        "latency and queries per order. Runs in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--orders', type=int, default=1000, help="Actions after the book is seeded.")
+        parser.add_argument('--pairs', type=int, default=1)
+        parser.add_argument('--depth', type=int, default=50, help="Seeded price levels per side and pair.")
+        parser.add_argument('--market-ratio', type=float, default=0.1)
+        parser.add_argument('--cancel-ratio', type=float, default=0.2)
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument(
+            '--engine', choices=['current', 'baseline', 'both'], default='both',
+            help="'baseline' is the original nested-loop matcher.",
+        )
+
+    def handle(self, *args, **options):
+        flow = bench.synthetic_flow(
+            seed=options['seed'],
+            orders=options['orders'],
+            pairs=options['pairs'],
+            depth=options['depth'],
+            market_ratio=options['market_ratio'],
+            cancel_ratio=options['cancel_ratio'],
+            users=options['users'],
+        )
+        engines = ['current', 'baseline'] if options['engine'] == 'both' else [options['engine']]
+        self.stdout.write(
+            f"{len(flow)} actions, seed {options['seed']}, {options['pairs']} pair(s), "
+            f"depth {options['depth']}, on {connection.vendor}"
+        )
+        self.stdout.write(f"{'engine':<10}{'orders':>8}{'rejected':>10}{'orders/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'queries/order':>15}{'trades':>8}")
+        for name in engines:
+            report = self._run(flow, name == 'baseline', options)
+            self.stdout.write(
+                f"{report.engine:<10}{report.orders:>8}{report.rejected:>10}{report.orders_per_second:>12.1f}"
+                f"{report.p50_ms:>10.2f}{report.p99_ms:>10.2f}{report.queries_per_order:>15.1f}{report.trades:>8}"
+            )
+
+    def _run(self, flow, baseline, options):
+        # A fresh database per engine, so neither sees the other's orders.
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            return bench.run(flow, baseline=baseline, pairs=options['pairs'], users=options['users'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
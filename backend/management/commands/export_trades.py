@@ -0,0 +1,55 @@
+from datetime import timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from backend import history, pairs
+from backend.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Stream one user's trade history, oldest first, as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help="Email or username.")
+        parser.add_argument('--format', choices=list(history.FORMATS), default='csv')
+        parser.add_argument('--pair', metavar='BASE-QUOTE')
+        parser.add_argument('--start', help="ISO 8601, inclusive.")
+        parser.add_argument('--end', help="ISO 8601, exclusive.")
+        parser.add_argument('--output', '-o', help="File to write; standard output by default.")
+        parser.add_argument('--chunk-size', type=int, default=history.EXPORT_CHUNK_SIZE, help="Rows fetched per query.")
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.filter(email=options['user']).first() or CustomUser.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"Unknown user '{options['user']}'.")
+        pair = None
+        if options['pair']:
+            pair = pairs.pair_ids(options['pair'])
+            if pair is None:
+                raise CommandError(f"Unknown pair '{options['pair']}', expected BASE-QUOTE.")
+        start, end = self._parse_time(options['start']), self._parse_time(options['end'])
+        queryset = history.history(user.id, pair=pair, start=start, end=end).reverse()
+        output = open(options['output'], 'w', newline='') if options['output'] else self.stdout
+        try:
+            count = 0
+            for count, line in enumerate(history.export(queryset, options['format'], options['chunk_size']), 1):
+                output.write(line)
+        finally:
+            if output is not self.stdout:
+                output.close()
+        if options['output']:
+            self.stderr.write(f"Wrote {count} lines to {options['output']}.")
+
+    def _parse_time(self, value):
+        if value is None:
+            return None
+        try:
+            timestamp = parse_datetime(value)
+        except ValueError:
+            timestamp = None
+        if timestamp is None:
+            raise CommandError(f"Invalid timestamp '{value}', expected ISO 8601.")
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp
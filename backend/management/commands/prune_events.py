@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from backend.models import OrderEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete OrderEvents the matcher processed more than --hours ago. Parked events are kept "
+        "for inspection; the queue itself only ever reads pending rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help="Keep events processed within this many hours.")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Events deleted per statement.")
+
+    def handle(self, *args, **options):
+        if options['hours'] < 0 or options['batch_size'] < 1:
+            raise CommandError("--hours must be >= 0 and --batch-size >= 1.")
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        processed = OrderEvent.objects.filter(processed_at__lt=cutoff).order_by('processed_at')
+        count = 0
+        while True:
+            # Short deletes keep the matchers' inserts and claims from queueing behind one big one.
+            ids = list(processed.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            count += OrderEvent.objects.filter(id__in=ids).delete()[0]
+            self.stdout.write(f"Pruned {count} events...", ending='\r')
+        self.stdout.write(f"Pruned {count} events processed before {cutoff:%Y-%m-%d %H:%M}.")
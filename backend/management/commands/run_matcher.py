@@ -0,0 +1,50 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend import metrics
+from backend.checks import shared_cache_errors
+from backend.engine import engine
+from backend.matcher import MatcherWorker
+from backend.pairs import pair_ids
+
+
+class Command(BaseCommand):
+    help = "Run the matching engine as a single-writer worker fed by the OrderEvent queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pair', action='append', dest='pairs', metavar='BASE/QUOTE',
+            help="Only match this pair (repeatable). By default the worker claims every pair no other worker owns.",
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--poll-interval', type=float, default=0.05, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics on this port (needs METRICS_ENABLED).")
+
+    def handle(self, *args, **options):
+        errors = shared_cache_errors()
+        if errors:
+            # A process-local cache would leave this worker on stale fees and pairs, and publish to no one.
+            raise CommandError(f"{errors[0].msg} {errors[0].hint}")
+        pairs = None
+        if options['pairs']:
+            pairs = [self._resolve(pair) for pair in options['pairs']]
+        worker = MatcherWorker(pairs=pairs, batch_size=options['batch_size'])
+        if options['metrics_port']:
+            if not metrics.enabled:
+                raise CommandError("--metrics-port needs METRICS_ENABLED=1.")
+            metrics.serve(options['metrics_port'])
+        # Stop on SIGTERM (what process managers send) exactly as on Ctrl-C, flushing the LTPs first.
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        self.stdout.write("Matcher started.")
+        try:
+            worker.run_forever(poll_interval=options['poll_interval'])
+        except KeyboardInterrupt:
+            engine.flush_last_prices(force=True)
+            self.stdout.write("Matcher stopped.")
+
+    def _resolve(self, pair):
+        ids = pair_ids(pair.replace('/', '-'))
+        if ids is None:
+            raise CommandError(f"Unknown pair '{pair}', expected BASE/QUOTE.")
+        return ids
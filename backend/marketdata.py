@@ -0,0 +1,134 @@
+from django.core.cache import cache
+from django.utils import timezone
+
+from .fixedpoint import to_decimal
+from .models import LastTradedPrice
+from .pairs import pair_symbol
+
+# Levels kept per side in a published snapshot; readers can ask for fewer.
+DEPTH_LEVELS = 100
+# Messages kept per pair for stream subscribers to catch up from.
+EVENT_LOG_SIZE = 1000
+# Seconds an LTP read back from the table stays cached. The row trails the
+# matcher by up to its flush interval, so it must not outlive a newer publish.
+LTP_FALLBACK_TIMEOUT = 5
+
+
+def depth_key(pair):
+    return f'marketdata:depth:{pair}'
+
+
+def events_key(pair):
+    return f'marketdata:events:{pair}'
+
+
+def ltp_key(pair):
+    return f'marketdata:ltp:{pair}'
+
+
+# --- L2 depth ---
+# The matcher publishes an aggregated snapshot of each book it changes;
+# readers only ever hit the cache, never the Order table.
+
+def publish_depth(book):
+    """Cache a fresh snapshot of `book` and return the diff against the previous one."""
+    pair = pair_symbol(book.base_currency_id, book.quote_currency_id)
+    previous = cache.get(depth_key(pair))
+    snapshot = {
+        'pair': pair,
+        'sequence': book.sequence,
+        'timestamp': timezone.now().isoformat(),
+        'bids': [[str(to_decimal(price)), str(to_decimal(qty))] for price, qty in book.bids.depth(DEPTH_LEVELS)],
+        'asks': [[str(to_decimal(price)), str(to_decimal(qty))] for price, qty in book.asks.depth(DEPTH_LEVELS)],
+    }
+    cache.set(depth_key(pair), snapshot, None)
+    return {
+        'type': 'depth',
+        'pair': pair,
+        'sequence': snapshot['sequence'],
+        'prev_sequence': previous['sequence'] if previous else None,
+        'bids': _diff_levels(previous['bids'] if previous else [], snapshot['bids']),
+        'asks': _diff_levels(previous['asks'] if previous else [], snapshot['asks']),
+    }
+
+
+def _diff_levels(old, new):
+    # Changed levels with their new quantity; levels that left the view get '0'.
+    old, new = dict(old), dict(new)
+    changes = [[price, qty] for price, qty in new.items() if old.get(price) != qty]
+    changes += [[price, '0'] for price in old if price not in new]
+    return changes
+
+
+def get_depth(pair, levels=DEPTH_LEVELS):
+    snapshot = cache.get(depth_key(pair))
+    if snapshot is None:
+        return None
+    return dict(snapshot, bids=snapshot['bids'][:levels], asks=snapshot['asks'][:levels])
+
+
+def last_sequence(base_currency_id, quote_currency_id):
+    """Sequence of the last published snapshot, so a reloaded book carries on from it."""
+    snapshot = cache.get(depth_key(pair_symbol(base_currency_id, quote_currency_id)))
+    return snapshot['sequence'] if snapshot else 0
+
+
+# --- Last traded price ---
+# The matcher caches each pair's LTP as it commits trades and writes the
+# LastTradedPrice row behind, so the row can lag by a flush interval.
+
+def publish_last_price(pair, price):
+    cache.set(ltp_key(pair), price, None)
+
+
+def last_price(base_currency_id, quote_currency_id):
+    """A pair's LTP as a Decimal, or None if it never traded."""
+    key = ltp_key(pair_symbol(base_currency_id, quote_currency_id))
+    price = cache.get(key)
+    if price is None:
+        price = (
+            LastTradedPrice.objects.filter(base_currency_id=base_currency_id, quote_currency_id=quote_currency_id)
+            .values_list('price', flat=True)
+            .first()
+        )
+        if price is not None:
+            # add(), not set(): a price the matcher published meanwhile is newer.
+            cache.add(key, price, LTP_FALLBACK_TIMEOUT)
+    return price
+
+
+# --- Event stream ---
+# Trades, LTP changes and depth diffs per pair, numbered so a subscriber can
+# tell whether it missed anything. Only the pair's matcher appends to a log.
+
+def publish_events(pair, messages):
+    if not messages:
+        return
+    log = cache.get(events_key(pair)) or {'last_id': 0, 'messages': []}
+    for message in messages:
+        log['last_id'] += 1
+        message['id'] = log['last_id']
+    log['messages'] = (log['messages'] + messages)[-EVENT_LOG_SIZE:]
+    cache.set(events_key(pair), log, None)
+
+
+def trade_message(pair, trade):
+    return {
+        'type': 'trade',
+        'pair': pair,
+        'price': str(trade.price),
+        'quantity': str(trade.quantity),
+        'timestamp': trade.traded_at.isoformat(),
+    }
+
+
+def ltp_message(pair, price, timestamp):
+    return {'type': 'ltp', 'pair': pair, 'price': str(price), 'timestamp': timestamp.isoformat()}
+
+
+def get_events(pair, after_id):
+    """(last_id, messages newer than after_id) from a pair's stream."""
+    log = cache.get(events_key(pair))
+    if log is None:
+        return 0, []
+    return log['last_id'], [message for message in log['messages'] if message['id'] > after_id]
@@ -0,0 +1,139 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import ticker
+from .engine import engine
+from .models import OrderEvent
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_order(order):
+    """Hand a newly placed order over to the matcher of its pair."""
+    OrderEvent.objects.create(
+        order=order,
+        type=OrderEvent.EventType.PLACE,
+        base_currency_id=order.base_currency_id,
+        quote_currency_id=order.quote_currency_id,
+    )
+    if settings.MATCHER_INLINE:
+        # Match once the order and its event are committed, as submit_batch() does.
+        transaction.on_commit(inline_worker.run_once)
+
+
+class MatcherWorker:
+    """
+    Drains the OrderEvent outbox for the pairs it owns. Each pair has a
+    single writer: on PostgreSQL ownership is an advisory lock held for the
+    life of the worker's connection, so several workers can split the pairs
+    between them while matching within a pair stays lock-free.
+    """
+
+    # How often pairs owned by another worker are retried, in case it died.
+    RECLAIM_INTERVAL = 30
+
+    def __init__(self, pairs=None, batch_size=500):
+        self.wanted = set(pairs) if pairs is not None else None
+        self.pairs = set()
+        self.foreign = set()
+        self.foreign_since = time.monotonic()
+        self.batch_size = batch_size
+
+    def claim(self, pair):
+        if connection.vendor != 'postgresql':
+            return True
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', list(pair))
+            return cursor.fetchone()[0]
+
+    def claim_pairs(self):
+        if time.monotonic() - self.foreign_since > self.RECLAIM_INTERVAL:
+            self.foreign = set()
+            self.foreign_since = time.monotonic()
+        if self.wanted is not None:
+            candidates = self.wanted
+        else:
+            candidates = (
+                OrderEvent.objects.filter(processed_at=None, failed_at=None)
+                .values_list('base_currency_id', 'quote_currency_id')
+                .distinct()
+            )
+        for pair in candidates:
+            if pair in self.pairs or pair in self.foreign:
+                continue
+            if self.claim(pair):
+                self.pairs.add(pair)
+                engine.warm(*pair)
+            else:
+                logger.info('Pair %s/%s is owned by another matcher', *pair)
+                self.foreign.add(pair)
+
+    def run_once(self):
+        """Process one batch of pending events and return how many were handled."""
+        self.claim_pairs()
+        if not self.pairs:
+            return 0
+        owned = Q()
+        for base_id, quote_id in self.pairs:
+            owned |= Q(base_currency_id=base_id, quote_currency_id=quote_id)
+
+        pending = (
+            OrderEvent.objects.select_related('order')
+            .filter(owned, processed_at=None, failed_at=None)
+            .order_by('id')
+        )
+        try:
+            processed = engine.process_events(pending.select_for_update(skip_locked=True)[:self.batch_size])
+        except Exception:
+            if not connection.is_usable():
+                raise
+            logger.exception('Matching batch failed, retrying its events one by one')
+            processed = self.run_isolated(pending[:self.batch_size])
+        engine.flush_last_prices()
+        return processed
+
+    def run_isolated(self, events):
+        """
+        Apply `events` one per pass, so a poison event only rolls back
+        itself. An event that fails on its own is parked for good.
+        """
+        processed = 0
+        for event in list(events):
+            try:
+                processed += engine.process_events(
+                    OrderEvent.objects.select_for_update(skip_locked=True)
+                    .select_related('order')
+                    .filter(id=event.id, processed_at=None, failed_at=None)
+                )
+            except Exception as exc:
+                if not connection.is_usable():
+                    raise
+                logger.exception('Parking event %s', event.id)
+                engine.park(event, repr(exc))
+                processed += 1
+        return processed
+
+    def run_forever(self, poll_interval=0.05):
+        while True:
+            try:
+                busy = self.run_once()
+                if not busy:
+                    ticker.refresh()
+            except Exception:
+                logger.exception('Matcher pass failed')
+                if not connection.is_usable():
+                    # A new connection has none of the advisory locks: claim the pairs again.
+                    connection.close()
+                    self.pairs = set()
+                    engine.reset()
+                busy = 0
+            if not busy:
+                time.sleep(poll_interval)
+
+
+# Drains the queue from inside the request when MATCHER_INLINE is set.
+inline_worker = MatcherWorker()
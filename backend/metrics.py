@@ -0,0 +1,189 @@
+"""
+Instrumentation for the matching and settlement hot path.
+
+Each process keeps its own counters and histograms: per-phase timings and
+query counts, engine lock waits, events and fills per matching pass. They
+are exposed in the Prometheus text format (the web app's /metrics, or a
+port of the run_matcher worker) and every matching pass is logged as one
+JSON line on the 'backend.metrics' logger.
+
+Off unless settings.METRICS_ENABLED is set; phase() and matching_pass()
+then hand back a shared no-op context manager and nothing is recorded.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+enabled = settings.METRICS_ENABLED
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+METRICS = {
+    'matching_phase_seconds': ('histogram', SECONDS_BUCKETS, "Time spent in a matching or settlement phase."),
+    'matching_phase_queries_total': ('counter', None, "Database queries issued inside a phase."),
+    'matching_lock_wait_seconds': ('histogram', SECONDS_BUCKETS, "Wait for the engine lock before a matching pass."),
+    'matching_passes_total': ('counter', None, "Matching passes committed."),
+    'matching_events_per_pass': ('histogram', COUNT_BUCKETS, "Queued order events applied per matching pass."),
+    'matching_fills_per_pass': ('histogram', COUNT_BUCKETS, "Fills produced per matching pass."),
+    'matching_fills_total': ('counter', None, "Fills produced."),
+}
+
+_NOOP = nullcontext()
+_lock = threading.Lock()
+_local = threading.local()
+_counters = defaultdict(float)
+_histograms = {}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def inc(name, amount=1, **labels):
+    if not enabled:
+        return
+    with _lock:
+        _counters[name, tuple(sorted(labels.items()))] += amount
+
+
+def observe(name, value, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(METRICS[name][1])
+        histogram.observe(value)
+
+
+def phase(name):
+    """Time a block and count its queries as phase `name`."""
+    if not enabled:
+        return _NOOP
+    return _phase(name)
+
+
+@contextmanager
+def _phase(name):
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    started_at = time.perf_counter()
+    try:
+        with connection.execute_wrapper(count):
+            yield
+    finally:
+        seconds = time.perf_counter() - started_at
+        observe('matching_phase_seconds', seconds, phase=name)
+        inc('matching_phase_queries_total', queries[0], phase=name)
+        summary = getattr(_local, 'summary', None)
+        if summary is not None:
+            summary['phases'][name] = summary['phases'].get(name, 0) + round(seconds * 1000, 3)
+            summary['queries'][name] = summary['queries'].get(name, 0) + queries[0]
+
+
+def matching_pass():
+    """Collect the phases of one matching pass and log them as a single line."""
+    if not enabled:
+        return _NOOP
+    return _matching_pass()
+
+
+@contextmanager
+def _matching_pass():
+    summary = _local.summary = {'event': 'matching_pass', 'events': 0, 'fills': 0, 'lock_wait_ms': 0, 'phases': {}, 'queries': {}}
+    try:
+        with phase('pass'):
+            yield
+    finally:
+        _local.summary = None
+    inc('matching_passes_total')
+    inc('matching_fills_total', summary['fills'])
+    observe('matching_events_per_pass', summary['events'])
+    observe('matching_fills_per_pass', summary['fills'])
+    logger.info(json.dumps(summary))
+
+
+def record(**values):
+    """Add per-pass figures (events, fills, lock_wait_ms) to the current pass' log line."""
+    if not enabled:
+        return
+    summary = getattr(_local, 'summary', None)
+    if summary is not None:
+        for key, value in values.items():
+            summary[key] += value
+
+
+def render():
+    """All metrics of this process in the Prometheus text format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (list(h.counts), h.sum) for key, h in _histograms.items()}
+    lines = []
+    for name, (kind, buckets, help_text) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {value:g}')
+            continue
+        for (metric, labels), (counts, total) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + (None,), counts):
+                cumulative += count
+                le = '+Inf' if bound is None else f'{bound:g}'
+                lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total:g}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port):
+    """Expose this process' metrics on `port` from a background thread (for the matcher worker)."""
+    server = ThreadingHTTPServer(('', port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_alter_balance_options_alter_charge_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('place', 'Place')], default='place', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('base_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.currency')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='backend.order')),
+                ('quote_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.currency')),
+            ],
+            options={
+                'verbose_name_plural': 'Order Event',
+                'indexes': [models.Index(fields=['base_currency', 'quote_currency', 'processed_at', 'id'], name='orderevent_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def provision_balances(apps, schema_editor):
+    Balance = apps.get_model('backend', 'Balance')
+    Currency = apps.get_model('backend', 'Currency')
+    CustomUser = apps.get_model('backend', 'CustomUser')
+    currency_ids = list(Currency.objects.values_list('id', flat=True))
+    for user_id in CustomUser.objects.values_list('id', flat=True).iterator():
+        Balance.objects.bulk_create(
+            [Balance(user_id=user_id, currency_id=currency_id) for currency_id in currency_ids],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_orderevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(provision_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def compute_locked(apps, schema_editor):
+    Balance = apps.get_model('backend', 'Balance')
+    Order = apps.get_model('backend', 'Order')
+    open_orders = Order.objects.filter(status__in=['pending', 'partial'], locked_funds__gt=0)
+    reservations = [
+        open_orders.filter(type='buy').values('user_id', currency_id=models.F('quote_currency_id')),
+        open_orders.filter(type='sell').values('user_id', currency_id=models.F('base_currency_id')),
+    ]
+    for rows in reservations:
+        for row in rows.annotate(total=Sum('locked_funds')).iterator():
+            Balance.objects.filter(user_id=row['user_id'], currency_id=row['currency_id']).update(
+                locked=models.F('locked') + row['total']
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_provision_balances'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='balance',
+            old_name='amount',
+            new_name='available',
+        ),
+        migrations.AddField(
+            model_name='balance',
+            name='locked',
+            field=models.DecimalField(decimal_places=8, default=0, max_digits=20),
+        ),
+        migrations.RunPython(compute_locked, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='balance',
+            constraint=models.CheckConstraint(condition=models.Q(available__gte=0), name='balance_available_non_negative'),
+        ),
+        migrations.AddConstraint(
+            model_name='balance',
+            constraint=models.CheckConstraint(condition=models.Q(locked__gte=0), name='balance_locked_non_negative'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_balance_available_locked'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['base_currency', 'quote_currency', 'type', 'status', 'price', 'created_at'], name='order_pair_book_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'partial'])), fields=['base_currency', 'quote_currency', 'type', 'price', 'created_at'], name='order_open_book_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'partial'])), fields=['user', 'base_currency', 'quote_currency'], name='order_open_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['buyer', 'traded_at'], name='trade_buyer_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['seller', 'traded_at'], name='trade_seller_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['base_currency', 'quote_currency', 'traded_at'], name='trade_pair_time_idx'),
+        ),
+    ]
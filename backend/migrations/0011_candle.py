@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1m', 'One Minute'), ('5m', 'Five Minutes'), ('1h', 'One Hour'), ('1d', 'One Day')], max_length=3)),
+                ('open_time', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('high', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('low', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('close', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('volume', models.DecimalField(decimal_places=8, default=0, max_digits=30)),
+                ('quote_volume', models.DecimalField(decimal_places=8, default=0, max_digits=30)),
+                ('trades', models.PositiveIntegerField(default=0)),
+                ('base_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.currency')),
+                ('quote_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.currency')),
+            ],
+            options={
+                'verbose_name_plural': 'Candle',
+                'constraints': [models.UniqueConstraint(fields=('base_currency', 'quote_currency', 'interval', 'open_time'), name='candle_pair_interval_time_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_candle'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderevent',
+            name='type',
+            field=models.CharField(choices=[('place', 'Place'), ('cancel', 'Cancel')], default='place', max_length=10),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_orderevent_cancel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTrade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('side', models.CharField(choices=[('buy', 'Buy'), ('sell', 'Sell')], max_length=10)),
+                ('price', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('quantity', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('fee', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('traded_at', models.DateTimeField()),
+                ('base_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.currency')),
+                ('order', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.order')),
+                ('quote_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.currency')),
+                ('trade', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.trade')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trade_history', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User Trade',
+                'indexes': [models.Index(fields=['user', 'traded_at', 'id'], name='usertrade_user_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('trade', 'side'), name='usertrade_trade_side_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+CHUNK_SIZE = 5000
+
+
+def backfill_user_trades(apps, schema_editor):
+    Trade = apps.get_model('backend', 'Trade')
+    UserTrade = apps.get_model('backend', 'UserTrade')
+    rows = []
+    for trade in Trade.objects.order_by('id').iterator(chunk_size=CHUNK_SIZE):
+        for side, user_id, order_id, fee in (
+            ('buy', trade.buyer_id, trade.buy_order_id, trade.fee_buyer),
+            ('sell', trade.seller_id, trade.sell_order_id, trade.fee_seller),
+        ):
+            if user_id is not None:
+                rows.append(UserTrade(
+                    user_id=user_id, trade_id=trade.id, order_id=order_id, side=side,
+                    base_currency_id=trade.base_currency_id, quote_currency_id=trade.quote_currency_id,
+                    price=trade.price, quantity=trade.quantity, fee=fee, traded_at=trade.traded_at,
+                ))
+        if len(rows) >= CHUNK_SIZE:
+            UserTrade.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+    UserTrade.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_usertrade'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_user_trades, migrations.RunPython.noop),
+    ]
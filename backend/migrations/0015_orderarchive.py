@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_backfill_user_trades'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('buy', 'Buy'), ('sell', 'Sell')], max_length=10)),
+                ('execution_type', models.CharField(choices=[('limit', 'Limit'), ('market', 'Market')], max_length=10)),
+                ('price', models.DecimalField(blank=True, decimal_places=8, max_digits=20, null=True)),
+                ('quantity', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('remaining_quantity', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('locked_funds', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('partial', 'Partial'), ('executed', 'Executed'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Order Archive',
+            },
+        ),
+        migrations.AlterField(
+            model_name='trade',
+            name='buy_order',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='buy_trades', to='backend.order'),
+        ),
+        migrations.AlterField(
+            model_name='trade',
+            name='sell_order',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='sell_trades', to='backend.order'),
+        ),
+        migrations.AlterField(
+            model_name='usertrade',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='backend.order'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['executed', 'cancelled'])), fields=['created_at', 'id'], name='order_closed_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='orderarchive',
+            name='base_currency',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.currency'),
+        ),
+        migrations.AddField(
+            model_name='orderarchive',
+            name='quote_currency',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.currency'),
+        ),
+        migrations.AddField(
+            model_name='orderarchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='orderarchive',
+            index=models.Index(fields=['user', 'created_at'], name='orderarchive_user_time_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:41
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_orderarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradingPair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tick_size', models.DecimalField(decimal_places=8, default=Decimal('1E-8'), max_digits=20)),
+                ('lot_size', models.DecimalField(decimal_places=8, default=Decimal('1E-8'), max_digits=20)),
+                ('min_notional', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('active', models.BooleanField(default=True)),
+                ('base_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='base_pairs', to='backend.currency')),
+                ('quote_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quote_pairs', to='backend.currency')),
+            ],
+            options={
+                'verbose_name_plural': 'Trading Pair',
+                'constraints': [models.UniqueConstraint(fields=('base_currency', 'quote_currency'), name='tradingpair_pair_uniq'), models.CheckConstraint(condition=models.Q(('lot_size__gt', 0), ('tick_size__gt', 0)), name='tradingpair_increments_positive')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def register_trading_pairs(apps, schema_editor):
+    """Give every pair that already has fees, a price or orders a TradingPair with the default rules."""
+    TradingPair = apps.get_model('backend', 'TradingPair')
+    keys = set()
+    for model_name in ('Charge', 'LastTradedPrice', 'Order'):
+        model = apps.get_model('backend', model_name)
+        keys.update(model.objects.values_list('base_currency_id', 'quote_currency_id').distinct())
+    TradingPair.objects.bulk_create(
+        [TradingPair(base_currency_id=base_id, quote_currency_id=quote_id) for base_id, quote_id in keys],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_tradingpair'),
+    ]
+
+    operations = [
+        migrations.RunPython(register_trading_pairs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_register_trading_pairs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderevent',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='orderevent',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_orderevent_failed'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='orderevent',
+            name='orderevent_queue_idx',
+        ),
+        migrations.AddIndex(
+            model_name='orderevent',
+            index=models.Index(condition=models.Q(('failed_at', None), ('processed_at', None)), fields=['base_currency', 'quote_currency', 'id'], name='orderevent_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderevent',
+            index=models.Index(condition=models.Q(('processed_at__isnull', False)), fields=['processed_at'], name='orderevent_processed_idx'),
+        ),
+    ]
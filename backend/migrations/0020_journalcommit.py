@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def record_processed_events(apps, schema_editor):
+    """Carry over what the journals were checked against so far: each pair's newest processed event."""
+    OrderEvent = apps.get_model('backend', 'OrderEvent')
+    JournalCommit = apps.get_model('backend', 'JournalCommit')
+    newest = (
+        OrderEvent.objects.exclude(processed_at=None)
+        .values_list('base_currency_id', 'quote_currency_id')
+        .annotate(last_event_id=Max('id'))
+    )
+    JournalCommit.objects.bulk_create([
+        JournalCommit(base_currency_id=base_id, quote_currency_id=quote_id, last_event_id=last_event_id)
+        for base_id, quote_id, last_event_id in newest
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0019_orderevent_pending_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalCommit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('base_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.currency')),
+                ('quote_currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.currency')),
+            ],
+            options={
+                'verbose_name_plural': 'Journal Commit',
+                'constraints': [models.UniqueConstraint(fields=('base_currency', 'quote_currency'), name='journalcommit_pair_uniq')],
+            },
+        ),
+        migrations.RunPython(record_processed_events, migrations.RunPython.noop),
+    ]
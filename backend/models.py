@@ -1,4 +1,6 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
 
 # Create your models here.
 from django.contrib.auth.models import AbstractUser
@@ -26,12 +28,21 @@ class Currency(models.Model):
     
 class Balance(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    amount = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    available = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    locked = models.DecimalField(max_digits=20, decimal_places=8, default=0)
     currency =models.ForeignKey(Currency, on_delete=models.CASCADE)
     
     class Meta:
         verbose_name_plural = "Balance"
         unique_together = ('user', 'currency')
+        constraints = [
+            models.CheckConstraint(condition=models.Q(available__gte=0), name='balance_available_non_negative'),
+            models.CheckConstraint(condition=models.Q(locked__gte=0), name='balance_locked_non_negative'),
+        ]
+
+    @property
+    def total(self):
+        return self.available + self.locked
         
 class WalletTransaction(models.Model):
     class TransactionType(models.TextChoices):
@@ -83,14 +94,43 @@ class Order(models.Model):
     locked_funds = models.DecimalField(max_digits=20, decimal_places=8, default=0)
     status = models.CharField(max_length=10, choices=OrderStatus.choices, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        # The signal hooks reserve funds for a new order and queue it; that
+        # commits together with the insert or not at all.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name_plural = "Order"
+        indexes = [
+            models.Index(fields=['base_currency', 'quote_currency', 'type', 'status', 'price', 'created_at'], name='order_pair_book_idx'),
+            # The live book: only pending/partial rows are indexed.
+            models.Index(
+                fields=['base_currency', 'quote_currency', 'type', 'price', 'created_at'],
+                name='order_open_book_idx',
+                condition=models.Q(status__in=['pending', 'partial']),
+            ),
+            models.Index(
+                fields=['user', 'base_currency', 'quote_currency'],
+                name='order_open_user_idx',
+                condition=models.Q(status__in=['pending', 'partial']),
+            ),
+            # What archive_orders moves out next.
+            models.Index(
+                fields=['created_at', 'id'],
+                name='order_closed_time_idx',
+                condition=models.Q(status__in=['executed', 'cancelled']),
+            ),
+        ]
 
 # --- 6. Trades ---
 class Trade(models.Model):
-    buy_order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, related_name='buy_trades')
-    sell_order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, related_name='sell_trades')
+    # Closed orders move to OrderArchive, so these ids may point there instead.
+    buy_order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='buy_trades')
+    sell_order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='sell_trades')
     buyer = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='buy_trades')
     seller = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='sell_trades')
     base_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='base_trades')
@@ -103,6 +143,11 @@ class Trade(models.Model):
     
     class Meta:
         verbose_name_plural = "Trade"
+        indexes = [
+            models.Index(fields=['buyer', 'traded_at'], name='trade_buyer_time_idx'),
+            models.Index(fields=['seller', 'traded_at'], name='trade_seller_time_idx'),
+            models.Index(fields=['base_currency', 'quote_currency', 'traded_at'], name='trade_pair_time_idx'),
+        ]
 
 # --- 7. Last Traded Price (LTP) ---
 class LastTradedPrice(models.Model):
@@ -126,3 +171,137 @@ class Charge(models.Model):
     class Meta:
         unique_together = ('base_currency', 'quote_currency')
         verbose_name_plural = "Charge"
+
+# --- 9. Matching queue ---
+class OrderEvent(models.Model):
+    """Outbox row handing an order (or its cancellation) over to the run_matcher worker of its pair."""
+    class EventType(models.TextChoices):
+        PLACE = 'place'
+        CANCEL = 'cancel'
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    type = models.CharField(max_length=10, choices=EventType.choices, default='place')
+    base_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='+')
+    quote_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Set when the matcher gives up on the event; it then leaves the queue for good.
+    failed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        verbose_name_plural = "Order Event"
+        indexes = [
+            # Only the pending rows: the matchers poll it constantly, processed rows are pruned later.
+            models.Index(
+                fields=['base_currency', 'quote_currency', 'id'],
+                condition=models.Q(processed_at=None, failed_at=None),
+                name='orderevent_pending_idx',
+            ),
+            models.Index(fields=['processed_at'], condition=models.Q(processed_at__isnull=False), name='orderevent_processed_idx'),
+        ]
+
+# --- 10. Candles ---
+class Candle(models.Model):
+    class Interval(models.TextChoices):
+        ONE_MINUTE = '1m'
+        FIVE_MINUTES = '5m'
+        ONE_HOUR = '1h'
+        ONE_DAY = '1d'
+
+    base_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='+')
+    quote_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='+')
+    interval = models.CharField(max_length=3, choices=Interval.choices)
+    open_time = models.DateTimeField()
+    open = models.DecimalField(max_digits=20, decimal_places=8)
+    high = models.DecimalField(max_digits=20, decimal_places=8)
+    low = models.DecimalField(max_digits=20, decimal_places=8)
+    close = models.DecimalField(max_digits=20, decimal_places=8)
+    volume = models.DecimalField(max_digits=30, decimal_places=8, default=0)
+    quote_volume = models.DecimalField(max_digits=30, decimal_places=8, default=0)
+    trades = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Candle"
+        constraints = [
+            models.UniqueConstraint(fields=['base_currency', 'quote_currency', 'interval', 'open_time'], name='candle_pair_interval_time_uniq'),
+        ]
+
+# --- 11. Trade history ---
+class UserTrade(models.Model):
+    """One participant's side of a Trade, so a user's history is one index range instead of buyer OR seller."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='trade_history')
+    trade = models.ForeignKey(Trade, on_delete=models.CASCADE, related_name='+')
+    order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    side = models.CharField(max_length=10, choices=Order.OrderType.choices)
+    base_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='+')
+    quote_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='+')
+    price = models.DecimalField(max_digits=20, decimal_places=8)
+    quantity = models.DecimalField(max_digits=20, decimal_places=8)
+    fee = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    traded_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "User Trade"
+        constraints = [
+            models.UniqueConstraint(fields=['trade', 'side'], name='usertrade_trade_side_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'traded_at', 'id'], name='usertrade_user_time_idx'),
+        ]
+
+# --- 12. Order archive ---
+class OrderArchive(models.Model):
+    """Executed and cancelled orders moved out of the Order table by archive_orders; ids are kept."""
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_orders')
+    type = models.CharField(max_length=10, choices=Order.OrderType.choices)
+    execution_type = models.CharField(max_length=10, choices=Order.ExecutionType.choices)
+    base_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='+')
+    quote_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='+')
+    price = models.DecimalField(max_digits=20, decimal_places=8, null=True, blank=True)
+    quantity = models.DecimalField(max_digits=20, decimal_places=8)
+    remaining_quantity = models.DecimalField(max_digits=20, decimal_places=8)
+    locked_funds = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    status = models.CharField(max_length=10, choices=Order.OrderStatus.choices)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Order Archive"
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='orderarchive_user_time_idx'),
+        ]
+
+# --- 13. Trading pairs ---
+class TradingPair(models.Model):
+    """Trading rules of a base/quote pair; read through the process-wide registry in backend.pairs."""
+    base_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='base_pairs')
+    quote_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='quote_pairs')
+    tick_size = models.DecimalField(max_digits=20, decimal_places=8, default=Decimal('0.00000001'))
+    lot_size = models.DecimalField(max_digits=20, decimal_places=8, default=Decimal('0.00000001'))
+    min_notional = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name_plural = "Trading Pair"
+        constraints = [
+            models.UniqueConstraint(fields=['base_currency', 'quote_currency'], name='tradingpair_pair_uniq'),
+            models.CheckConstraint(condition=models.Q(tick_size__gt=0, lot_size__gt=0), name='tradingpair_increments_positive'),
+        ]
+
+    def __str__(self):
+        return f"{self.base_currency.symbol}-{self.quote_currency.symbol}"
+
+# --- 14. Matching journal ---
+class JournalCommit(models.Model):
+    """Newest queue event of a pair whose matching pass committed; recovery checks the journal's last block against it."""
+    base_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='+')
+    quote_currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='+')
+    last_event_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Journal Commit"
+        constraints = [
+            models.UniqueConstraint(fields=['base_currency', 'quote_currency'], name='journalcommit_pair_uniq'),
+        ]
@@ -0,0 +1,187 @@
+from bisect import bisect_left, insort
+from collections import OrderedDict, namedtuple
+
+
+Fill = namedtuple('Fill', ['maker', 'taker', 'price', 'quantity'])
+
+
+class BookOrder:
+    """Lightweight in-memory view of an open Order resting in the book."""
+    __slots__ = ('id', 'user_id', 'side', 'price', 'remaining', 'locked')
+
+    def __init__(self, id, user_id, side, price, remaining, locked):
+        self.id = id
+        self.user_id = user_id
+        self.side = side
+        self.price = price
+        self.remaining = remaining
+        self.locked = locked
+
+    @property
+    def is_buy(self):
+        return self.side == 'buy'
+
+
+class PriceLevel:
+    """FIFO queue of orders resting at a single price."""
+    __slots__ = ('price', 'orders', 'quantity')
+
+    def __init__(self, price):
+        self.price = price
+        self.orders = OrderedDict()
+        self.quantity = 0
+
+    def append(self, order):
+        self.orders[order.id] = order
+        self.quantity += order.remaining
+
+    def remove(self, order_id):
+        order = self.orders.pop(order_id)
+        self.quantity -= order.remaining
+        return order
+
+    def head(self):
+        return next(iter(self.orders.values()))
+
+    def __bool__(self):
+        return bool(self.orders)
+
+
+class BookSide:
+    """One side of the book: price levels kept sorted, best price first."""
+
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        self.levels = {}
+        self.prices = []  # ascending
+
+    def best(self):
+        if not self.prices:
+            return None
+        return self.levels[self.prices[-1] if self.is_bid else self.prices[0]]
+
+    def add(self, order):
+        level = self.levels.get(order.price)
+        if level is None:
+            level = self.levels[order.price] = PriceLevel(order.price)
+            insort(self.prices, order.price)
+        level.append(order)
+
+    def remove(self, order):
+        level = self.levels[order.price]
+        level.remove(order.id)
+        if not level:
+            self._drop(level)
+
+    def _drop(self, level):
+        del self.levels[level.price]
+        del self.prices[bisect_left(self.prices, level.price)]
+
+    def depth(self, levels):
+        """Aggregated (price, quantity) of the best `levels` levels, best first."""
+        prices = self.prices[::-1] if self.is_bid else self.prices
+        return [(price, self.levels[price].quantity) for price in prices[:levels]]
+
+    def crosses(self, price, limit):
+        # A taker at `limit` crosses a resting level at `price` on this side.
+        # A market taker (no limit) crosses every level.
+        if limit is None:
+            return True
+        if self.is_bid:
+            return price >= limit
+        return price <= limit
+
+    def __len__(self):
+        return len(self.prices)
+
+
+class OrderBook:
+    """Price-time priority book for a single base/quote pair."""
+
+    def __init__(self, base_currency_id, quote_currency_id):
+        self.base_currency_id = base_currency_id
+        self.quote_currency_id = quote_currency_id
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.orders = {}
+        # Bumped on every change so readers of a published view can tell it is stale.
+        self.sequence = 0
+
+    @property
+    def best_bid(self):
+        level = self.bids.best()
+        return level.price if level else None
+
+    @property
+    def best_ask(self):
+        level = self.asks.best()
+        return level.price if level else None
+
+    def side_of(self, order):
+        return self.bids if order.is_buy else self.asks
+
+    def add(self, order):
+        self.side_of(order).add(order)
+        self.orders[order.id] = order
+        self.sequence += 1
+
+    def remove(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is not None:
+            self.side_of(order).remove(order)
+            self.sequence += 1
+        return order
+
+    def update(self, order_id, remaining, locked):
+        """Set a resting order's remaining quantity and locked funds, dropping it once filled."""
+        order = self.orders[order_id]
+        self.side_of(order).levels[order.price].quantity -= order.remaining - remaining
+        order.remaining = remaining
+        order.locked = locked
+        if remaining <= 0:
+            self.remove(order_id)
+        else:
+            self.sequence += 1
+
+    def match(self, taker, budget=None):
+        """
+        Match `taker` against the opposite side, best level first, and
+        yield the resulting fills. Only levels that cross are visited;
+        filled makers are dropped from the book. The taker itself is not
+        added - the caller decides whether the remainder should rest.
+
+        Fills are yielded one at a time, so while the caller handles one
+        the taker's `remaining` reflects that fill and none after it.
+        Consume the generator fully: the book is only consistent at the end.
+
+        `budget`, if given, caps what the taker can pay: matching stops once
+        `budget.affordable(price)` returns nothing more at the current level.
+        """
+        opposite = self.asks if taker.is_buy else self.bids
+        filled = False
+        while taker.remaining > 0:
+            level = opposite.best()
+            if level is None or not opposite.crosses(level.price, taker.price):
+                break
+            while taker.remaining > 0 and level:
+                maker = level.head()
+                qty = min(taker.remaining, maker.remaining)
+                if budget is not None:
+                    qty = min(qty, budget.affordable(level.price))
+                    if qty <= 0:
+                        break
+                    budget.spend(level.price, qty)
+                taker.remaining -= qty
+                maker.remaining -= qty
+                level.quantity -= qty
+                if maker.remaining <= 0:
+                    level.orders.popitem(last=False)
+                    del self.orders[maker.id]
+                filled = True
+                yield Fill(maker, taker, level.price, qty)
+            if not level:
+                opposite._drop(level)
+            elif taker.remaining > 0:
+                break  # out of budget
+        if filled:
+            self.sequence += 1
@@ -0,0 +1,258 @@
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from . import fees, ledger, marketdata, metrics, pairs
+from .engine import OPEN_STATUSES
+from .fixedpoint import SCALE, mul, mul_up, to_decimal, to_units
+from .matcher import inline_worker
+from .ledger import InsufficientBalance
+from .models import Balance, Order, OrderEvent
+
+# Most orders (placements plus cancellations) accepted in one batch.
+MAX_BATCH_SIZE = 100
+
+
+class InvalidOrder(ValueError):
+    pass
+
+
+def funds_to_lock(order):
+    """(currency_id, amount) an order reserves while it is open."""
+    if order.type == Order.OrderType.BUY:
+        # Cover the worst-case fee as well so fills only dip into available funds
+        # for the odd unit of per-fill rounding (see Settlement.add_fill)
+        fee_rate = fees.max_fee_rate(order.base_currency_id, order.quote_currency_id)
+        price = to_units(order.price)
+        if order.execution_type == Order.ExecutionType.MARKET:
+            price = market_buy_price(order)
+        quantity = to_units(order.quantity)
+        return order.quote_currency_id, to_decimal(mul_up(price, quantity) + mul_up(price, quantity, fee_rate))
+    return order.base_currency_id, order.quantity
+
+
+def market_buy_price(order):
+    """
+    The per-unit quote budget of a market buy: its price, if one was given
+    as a protection limit, otherwise the last traded price plus the allowed
+    slippage. Whatever the sweep does not spend is released afterwards.
+    """
+    if order.price is not None:
+        return to_units(order.price)
+    last_price = marketdata.last_price(order.base_currency_id, order.quote_currency_id)
+    if last_price is None:
+        raise InvalidOrder("No reference price to budget a market buy on this pair.")
+    return mul(to_units(last_price), SCALE + to_units(settings.MARKET_BUY_SLIPPAGE))
+
+
+def build_order(user, spec):
+    """
+    An unsaved Order from an API spec such as
+    {"pair": "BTC-INR", "side": "buy", "type": "limit", "price": "100", "quantity": "0.5"}.
+    """
+    if not isinstance(spec, dict):
+        raise InvalidOrder("Each order must be an object.")
+    pair = str(spec.get('pair', '')).upper()
+    ids = pairs.pair_ids(pair)
+    if ids is None:
+        raise InvalidOrder(f"Unknown pair '{pair}'.")
+    side = spec.get('side')
+    if side not in Order.OrderType.values:
+        raise InvalidOrder("'side' must be 'buy' or 'sell'.")
+    execution_type = spec.get('type', Order.ExecutionType.LIMIT)
+    if execution_type not in Order.ExecutionType.values:
+        raise InvalidOrder("'type' must be 'limit' or 'market'.")
+    quantity = _amount(spec.get('quantity'), 'quantity')
+    price = spec.get('price')
+    if price is not None:
+        price = _amount(price, 'price')
+    elif execution_type == Order.ExecutionType.LIMIT:
+        raise InvalidOrder("A limit order needs a 'price'.")
+    base_id, quote_id = ids
+    return Order(
+        user=user,
+        type=side,
+        execution_type=execution_type,
+        base_currency_id=base_id,
+        quote_currency_id=quote_id,
+        price=price,
+        quantity=quantity,
+        remaining_quantity=quantity,
+    )
+
+
+def _amount(value, name):
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise InvalidOrder(f"'{name}' must be a decimal number.")
+    if not amount.is_finite() or not 0 < amount < 10 ** 12 or to_units(amount) != amount * SCALE:
+        raise InvalidOrder(f"'{name}' must be positive with at most 8 decimal places.")
+    return amount
+
+
+# --- Pre-trade checks ---
+# Run before anything is written, from the pair registry, the cached LTP
+# and two reads, so a bad order costs no insert and no rollback. The
+# reservation in place_orders() stays the authoritative funds check.
+
+def validate(orders):
+    """
+    Check unsaved orders against their pair's rules, the price band, the
+    open-order limit and available balances; raises InvalidOrder or
+    InsufficientBalance. Sets each order's locked_funds and returns the
+    funds they need per (user_id, currency_id).
+    """
+    with metrics.phase('validate'):
+        required = defaultdict(Decimal)
+        for order in orders:
+            check_rules(order)
+            currency_id, amount = funds_to_lock(order)
+            order.locked_funds = amount
+            required[order.user_id, currency_id] += amount
+        _check_open_orders(orders)
+        _check_balances(required)
+    return required
+
+
+def check_rules(order):
+    """Tick and lot size, minimum notional and price band of one order."""
+    pair = pairs.get(order.base_currency_id, order.quote_currency_id)
+    if pair is None:
+        raise InvalidOrder("Unknown pair.")
+    if not pair.active:
+        raise InvalidOrder(f"Trading on {pair.symbol} is suspended.")
+    quantity = to_units(order.quantity)
+    if quantity % pair.lot_size:
+        raise InvalidOrder(f"'quantity' must be a multiple of {to_decimal(pair.lot_size).normalize()}.")
+    if order.price is not None and to_units(order.price) % pair.tick_size:
+        raise InvalidOrder(f"'price' must be a multiple of {to_decimal(pair.tick_size).normalize()}.")
+    reference = marketdata.last_price(order.base_currency_id, order.quote_currency_id)
+    if order.execution_type == Order.ExecutionType.LIMIT and reference is not None:
+        band = to_units(settings.PRICE_BAND)
+        reference = to_units(reference)
+        price = to_units(order.price)
+        if not mul(reference, SCALE - band) <= price <= mul(reference, SCALE + band):
+            raise InvalidOrder(
+                f"'price' is more than {float(settings.PRICE_BAND) * 100:g}% away from the last traded price {to_decimal(reference)}."
+            )
+    price = order.price if order.price is not None else reference
+    if price is not None and mul(to_units(price), quantity) < pair.min_notional:
+        raise InvalidOrder(f"Order value is below the minimum of {to_decimal(pair.min_notional)} on {pair.symbol}.")
+
+
+def _check_open_orders(orders):
+    new = defaultdict(int)
+    for order in orders:
+        new[order.user_id] += 1
+    open_orders = dict(
+        Order.objects.filter(user_id__in=new, status__in=OPEN_STATUSES)
+        .values_list('user_id').annotate(count=Count('id')).values_list('user_id', 'count')
+    )
+    for user_id, count in new.items():
+        if open_orders.get(user_id, 0) + count > settings.MAX_OPEN_ORDERS:
+            raise InvalidOrder(f"At most {settings.MAX_OPEN_ORDERS} open orders are allowed.")
+
+
+def _check_balances(required):
+    if not required:
+        return
+    keys = Q()
+    for user_id, currency_id in required:
+        keys |= Q(user_id=user_id, currency_id=currency_id)
+    available = {
+        (user_id, currency_id): amount
+        for user_id, currency_id, amount in Balance.objects.filter(keys).values_list('user_id', 'currency_id', 'available')
+    }
+    for key, amount in required.items():
+        if available.get(key, 0) < amount:
+            raise InsufficientBalance("Insufficient balance to place order.")
+
+
+def reserve(required):
+    """Lock the funds validate() returned, one conditional UPDATE per (user, currency)."""
+    with metrics.phase('reserve'):
+        for (user_id, currency_id), amount in required.items():
+            ledger.reserve(user_id, currency_id, amount)
+
+
+def place_orders(orders):
+    """
+    Validate, reserve funds for and enqueue a list of unsaved orders with a
+    fixed number of statements: two reads, one conditional UPDATE per
+    (user, currency), one insert for the orders and one for their queue
+    events. The caller is expected to hold a transaction; one rejected
+    order rejects them all.
+    """
+    reserve(validate(orders))
+    with metrics.phase('enqueue'):
+        Order.objects.bulk_create(orders)
+        OrderEvent.objects.bulk_create([
+            OrderEvent(
+                order=order,
+                type=OrderEvent.EventType.PLACE,
+                base_currency_id=order.base_currency_id,
+                quote_currency_id=order.quote_currency_id,
+            )
+            for order in orders
+        ])
+    return orders
+
+
+def cancel_orders(user, order_ids=None, pair=None):
+    """
+    Queue the cancellation of `user`'s open orders: the given ids, those of
+    one (base_id, quote_id) pair, or all of them. The pair's matcher takes
+    each order out of its book and settles the whole lot with one balance
+    update and one order update. Returns the ids of the orders queued.
+    """
+    orders = Order.objects.filter(user=user, status__in=OPEN_STATUSES)
+    if order_ids is not None:
+        orders = orders.filter(id__in=order_ids)
+    if pair is not None:
+        orders = orders.filter(base_currency_id=pair[0], quote_currency_id=pair[1])
+    orders = list(orders.values_list('id', 'base_currency_id', 'quote_currency_id'))
+    OrderEvent.objects.bulk_create([
+        OrderEvent(
+            order_id=order_id,
+            type=OrderEvent.EventType.CANCEL,
+            base_currency_id=base_id,
+            quote_currency_id=quote_id,
+        )
+        for order_id, base_id, quote_id in orders
+    ])
+    return [order_id for order_id, _, _ in orders]
+
+
+def cancel(user, order_ids=None, pair=None):
+    """cancel_orders() in its own transaction, matched right away when MATCHER_INLINE is set."""
+    with transaction.atomic():
+        cancelled = cancel_orders(user, order_ids, pair)
+    if settings.MATCHER_INLINE and cancelled:
+        inline_worker.run_once()
+    return cancelled
+
+
+def submit_batch(user, place=(), cancel=()):
+    """
+    Queue a batch of cancellations and placements in one transaction.
+    Cancellations are queued first so the matcher applies them before the
+    new orders. Matching then runs once over the whole batch.
+    """
+    if len(place) + len(cancel) > MAX_BATCH_SIZE:
+        raise InvalidOrder(f"A batch holds at most {MAX_BATCH_SIZE} orders.")
+    orders = []
+    for index, spec in enumerate(place):
+        try:
+            orders.append(build_order(user, spec))
+        except InvalidOrder as e:
+            raise InvalidOrder(f"place[{index}]: {e}")
+    with transaction.atomic():
+        cancelled = cancel_orders(user, cancel) if cancel else []
+        placed = place_orders(orders)
+    if settings.MATCHER_INLINE and (placed or cancelled):
+        inline_worker.run_once()
+    return placed, cancelled
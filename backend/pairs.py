@@ -0,0 +1,83 @@
+"""
+Process-wide registry of currencies and trading pairs.
+
+Symbols, ids and each pair's trading rules are loaded in one go and kept
+until a Currency or TradingPair changes; like the fee schedule, other
+processes notice through a version stamp in the shared cache. Nothing on
+the matching path has to fetch a Currency.
+
+A pair without a TradingPair row trades with the smallest increments, no
+minimum notional, as long as both its currencies are active.
+"""
+from collections import namedtuple
+
+from django.db import DEFAULT_DB_ALIAS
+
+from .fixedpoint import to_units
+from .models import Currency, TradingPair
+from .versioned import VersionedValue
+
+# Increments and minimum notional in 1e-8 units.
+Pair = namedtuple('Pair', 'base_currency_id quote_currency_id symbol tick_size lot_size min_notional active')
+
+
+class Registry:
+    def __init__(self, currencies, trading_pairs):
+        self.symbols = {currency.id: currency.symbol for currency in currencies}
+        self.ids = {currency.symbol: currency.id for currency in currencies}
+        self.active = {currency.id for currency in currencies if currency.active}
+        self.pairs = {(pair.base_currency_id, pair.quote_currency_id): pair for pair in trading_pairs}
+
+
+def _load():
+    return Registry(
+        Currency.objects.using(DEFAULT_DB_ALIAS).only('id', 'symbol', 'active'),
+        TradingPair.objects.using(DEFAULT_DB_ALIAS),
+    )
+
+
+_registry = VersionedValue('pairs:version', _load, 'pair_refresh')
+
+
+def get(base_currency_id, quote_currency_id):
+    """The Pair of two currency ids, or None if either currency is unknown."""
+    registry = _registry.get()
+    if base_currency_id not in registry.symbols or quote_currency_id not in registry.symbols:
+        return None
+    active = base_currency_id in registry.active and quote_currency_id in registry.active
+    symbol = f"{registry.symbols[base_currency_id]}-{registry.symbols[quote_currency_id]}"
+    rules = registry.pairs.get((base_currency_id, quote_currency_id))
+    if rules is None:
+        return Pair(base_currency_id, quote_currency_id, symbol, 1, 1, 0, active)
+    return Pair(
+        base_currency_id, quote_currency_id, symbol,
+        to_units(rules.tick_size), to_units(rules.lot_size), to_units(rules.min_notional), active and rules.active,
+    )
+
+
+def pair_symbol(base_currency_id, quote_currency_id):
+    """'BTC-INR' style name of a pair."""
+    registry = _registry.get()
+    return f"{registry.symbols[base_currency_id]}-{registry.symbols[quote_currency_id]}"
+
+
+def pair_ids(pair):
+    """(base_id, quote_id) of a 'BTC-INR' style name, or None if either symbol is unknown."""
+    try:
+        base, quote = pair.upper().split('-')
+    except ValueError:
+        return None
+    registry = _registry.get()
+    if base not in registry.ids or quote not in registry.ids:
+        return None
+    return registry.ids[base], registry.ids[quote]
+
+
+def reset():
+    """Drop this process' registry; it is reloaded on next use."""
+    _registry.reset()
+
+
+def invalidate():
+    """Drop this process' registry and tell every other process to do the same."""
+    _registry.invalidate()
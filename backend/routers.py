@@ -0,0 +1,34 @@
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Written only by settlement, the matcher or admins, and read far more often
+# than that: LTP, currencies, trades, history and candles.
+REPLICA_MODELS = {'currency', 'lasttradedprice', 'trade', 'usertrade', 'candle', 'orderarchive'}
+
+
+class ReplicaRouter:
+    """
+    Send reads of REPLICA_MODELS to a random replica in settings.DATABASE_REPLICAS
+    and everything else (balances, orders, the queue, all writes) to the primary.
+    Reads inside a transaction on the primary stay there, so the matcher and
+    the ledger never act on a lagging copy.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or model._meta.app_label != 'backend' or model._meta.model_name not in REPLICA_MODELS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,113 @@
+from collections import defaultdict
+
+from . import candles, fees, history, ledger, metrics
+from .fixedpoint import mul, to_decimal
+from .models import Order, Trade
+
+
+class Settlement:
+    """
+    Collects the effects of one matching pass in memory and writes them
+    with a fixed number of statements: one bulk insert for trades, one
+    bulk update for orders and one CASE update for balances, however
+    many fills the pass produced.
+
+    All amounts are fixed-point integers (see fixedpoint) until flush().
+    """
+
+    def __init__(self):
+        self.trades = []
+        self.orders = {}
+        self.available = defaultdict(int)
+        self.locked = defaultdict(int)
+        self.books = set()
+
+    def add_fill(self, book, fill):
+        maker, taker = fill.maker, fill.taker
+        buy, sell = (taker, maker) if taker.is_buy else (maker, taker)
+        total_trade_value = mul(fill.price, fill.quantity)
+
+        # The resting order is the maker, the incoming one the taker
+        maker_fee, taker_fee = fees.fees_for(book.base_currency_id, book.quote_currency_id)
+        fee_buyer = mul(fill.price, fill.quantity, taker_fee if buy is taker else maker_fee)
+        # Per-fill rounding can add a unit or two over the reservation. That
+        # comes off the buyer's fee first, but the fee never goes negative:
+        # whatever the notional alone overruns is drawn from available.
+        fee_buyer = max(0, min(fee_buyer, buy.locked - total_trade_value))
+        shortfall = total_trade_value + fee_buyer - buy.locked
+        if shortfall > 0:
+            buy.locked += shortfall
+            self.available[buy.user_id, book.quote_currency_id] -= shortfall
+            self.locked[buy.user_id, book.quote_currency_id] += shortfall
+        fee_seller = mul(fill.price, fill.quantity, taker_fee if sell is taker else maker_fee)
+
+        self.available[sell.user_id, book.quote_currency_id] += total_trade_value - fee_seller  # Seller gets quote
+        self.available[buy.user_id, book.base_currency_id] += fill.quantity  # Buyer gets base
+
+        # Consume locked funds
+        buy.locked -= total_trade_value + fee_buyer
+        sell.locked -= fill.quantity
+        self.locked[buy.user_id, book.quote_currency_id] -= total_trade_value + fee_buyer
+        self.locked[sell.user_id, book.base_currency_id] -= fill.quantity
+        self._order_changed(buy, book.quote_currency_id)
+        self._order_changed(sell, book.base_currency_id)
+
+        self.trades.append(Trade(
+            buy_order_id=buy.id,
+            sell_order_id=sell.id,
+            buyer_id=buy.user_id,
+            seller_id=sell.user_id,
+            base_currency_id=book.base_currency_id,
+            quote_currency_id=book.quote_currency_id,
+            price=to_decimal(fill.price),
+            quantity=to_decimal(fill.quantity),
+            fee_buyer=to_decimal(fee_buyer),
+            fee_seller=to_decimal(fee_seller),
+        ))
+
+    def _order_changed(self, order, locked_currency_id):
+        if order.remaining > 0:
+            status = Order.OrderStatus.PARTIAL
+        else:
+            status = Order.OrderStatus.EXECUTED
+            # Hand back whatever is still locked (e.g. a buy filled below its limit)
+            if order.locked:
+                self.available[order.user_id, locked_currency_id] += order.locked
+                self.locked[order.user_id, locked_currency_id] -= order.locked
+                order.locked = 0
+        self.orders[order.id] = Order(
+            id=order.id,
+            remaining_quantity=to_decimal(order.remaining),
+            locked_funds=to_decimal(order.locked),
+            status=status,
+        )
+
+    def cancel_remainder(self, book, order):
+        """Cancel what is left of an order and release its funds."""
+        locked_currency_id = book.quote_currency_id if order.is_buy else book.base_currency_id
+        self.available[order.user_id, locked_currency_id] += order.locked
+        self.locked[order.user_id, locked_currency_id] -= order.locked
+        order.locked = 0
+        self.orders[order.id] = Order(
+            id=order.id,
+            remaining_quantity=to_decimal(order.remaining),
+            locked_funds=to_decimal(0),
+            status=Order.OrderStatus.CANCELLED,
+        )
+
+    def flush(self):
+        if self.trades:
+            with metrics.phase('trade_insert'):
+                Trade.objects.bulk_create(self.trades)
+            with metrics.phase('trade_history'):
+                history.record_trades(self.trades)
+            with metrics.phase('candles'):
+                candles.record_trades(self.trades)
+        if self.orders:
+            with metrics.phase('order_update'):
+                Order.objects.bulk_update(self.orders.values(), ['remaining_quantity', 'locked_funds', 'status'])
+        with metrics.phase('ledger'):
+            ledger.apply_deltas(
+                available={key: to_decimal(delta) for key, delta in self.available.items()},
+                locked={key: to_decimal(delta) for key, delta in self.locked.items()},
+            )
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+
+from . import marketdata
+
+PATH_PATTERN = re.compile(r'^/ws/marketdata/(?P<pair>[A-Za-z0-9]+-[A-Za-z0-9]+)/?$')
+# How often a pair's feed checks the cache for new messages.
+POLL_INTERVAL = 0.1
+# Messages buffered per subscriber before it is told to resync.
+SUBSCRIBER_BUFFER = 1000
+
+RESYNC = {'type': 'resync'}
+
+
+class PairFeed:
+    """
+    Reads a pair's event stream from the cache once per poll and fans each
+    batch out to every subscriber in this process, so the cost of a message
+    does not grow with the number of subscribers.
+    """
+
+    def __init__(self, pair):
+        self.pair = pair
+        self.subscribers = set()
+        self.last_id = None
+        self.task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self.subscribers.add(queue)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    async def run(self):
+        while self.subscribers:
+            last_id, messages = await sync_to_async(marketdata.get_events)(self.pair, self.last_id or 0)
+            if self.last_id is None or last_id < self.last_id:
+                # First poll, or the log was reset: only what comes next is news.
+                messages = []
+            elif last_id > self.last_id and (not messages or messages[0]['id'] > self.last_id + 1):
+                # The log was trimmed past what this feed had read: every subscriber missed something.
+                for queue in list(self.subscribers):
+                    self.deliver(queue, RESYNC)
+                messages = []
+            self.last_id = last_id
+            for message in messages:
+                for queue in list(self.subscribers):
+                    self.deliver(queue, message)
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def deliver(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A slow consumer: drop its backlog and make it start from a snapshot.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+
+class Publisher:
+    def __init__(self):
+        self.feeds = {}
+
+    def feed(self, pair):
+        if pair not in self.feeds:
+            self.feeds[pair] = PairFeed(pair)
+        return self.feeds[pair]
+
+
+publisher = Publisher()
+
+
+async def websocket_application(scope, receive, send):
+    """
+    /ws/marketdata/<BASE-QUOTE>/ : sends the current depth snapshot, then
+    trade, ltp and depth-diff messages as they happen. A depth message
+    applies on top of the snapshot or diff whose sequence equals its
+    prev_sequence; on a gap, or on a 'resync' message, the client should
+    send {"action": "snapshot"} to get a fresh snapshot.
+    """
+    match = PATH_PATTERN.match(scope['path'])
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if match is None:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    await send({'type': 'websocket.accept'})
+
+    feed = publisher.feed(match['pair'].upper())
+    queue = feed.subscribe()
+    outgoing = incoming = None
+    try:
+        await send_snapshot(send, feed.pair)
+        outgoing = asyncio.ensure_future(queue.get())
+        incoming = asyncio.ensure_future(receive())
+        while True:
+            done, _ = await asyncio.wait({outgoing, incoming}, return_when=asyncio.FIRST_COMPLETED)
+            if outgoing in done:
+                event = outgoing.result()
+                if event is RESYNC:
+                    await send_json(send, RESYNC)
+                    await send_snapshot(send, feed.pair)
+                else:
+                    await send_json(send, event)
+                outgoing = asyncio.ensure_future(queue.get())
+            if incoming in done:
+                message = incoming.result()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if _action(message) == 'snapshot':
+                    await send_snapshot(send, feed.pair)
+                incoming = asyncio.ensure_future(receive())
+    finally:
+        for task in (outgoing, incoming):
+            if task is not None:
+                task.cancel()
+        feed.unsubscribe(queue)
+
+
+async def send_snapshot(send, pair):
+    snapshot = await sync_to_async(marketdata.get_depth)(pair)
+    await send_json(send, dict(snapshot or {'pair': pair, 'sequence': None, 'bids': [], 'asks': []}, type='snapshot'))
+
+
+async def send_json(send, payload):
+    await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+
+
+def _action(message):
+    try:
+        return json.loads(message.get('text') or '{}').get('action')
+    except (ValueError, AttributeError):
+        return None
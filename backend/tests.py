@@ -1,3 +1,1066 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import signal
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_EVEN
+from io import StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import bench, candles, checks, fees, fixedpoint, history, marketdata, metrics, orders, pairs, streaming, ticker
+from .engine import engine, resting_orders
+from .ledger import InsufficientBalance
+from .journal import CANCEL, Journal
+from .matcher import MatcherWorker
+from .models import (
+    Balance, Candle, Charge, CustomUser, Currency, JournalCommit, LastTradedPrice, Order, OrderArchive, OrderEvent, Trade,
+    TradingPair, UserTrade,
+)
+from .orderbook import BookOrder, OrderBook
+from .routers import ReplicaRouter
+
+
+class TradingPairMixin:
+    """
+    A buyer, a seller and the BTC-INR pair to trade on, plus clean-up of the
+    process-wide state (fee schedule, books, cache) trading leaves behind.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.buyer = CustomUser.objects.create(username='buyer', email='buyer@example.com')
+        self.seller = CustomUser.objects.create(username='seller', email='seller@example.com')
+        self.btc = Currency.objects.create(name='Bitcoin', symbol='BTC')
+        self.inr = Currency.objects.create(name='Indian Rupee', symbol='INR', is_crypto=False)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(engine.reset)
+        self.addCleanup(fees.invalidate)
+
+    def charge(self, maker_fee, taker_fee):
+        Charge.objects.create(
+            base_currency=self.btc, quote_currency=self.inr, maker_fee=Decimal(maker_fee), taker_fee=Decimal(taker_fee),
+        )
+        # The signal defers this to a commit a TestCase never reaches.
+        fees.invalidate()
+
+    def fund(self, user, currency, amount):
+        Balance.objects.filter(user=user, currency=currency).update(available=Decimal(amount))
+
+    def balance(self, user, currency):
+        return Balance.objects.values_list('available', 'locked').get(user=user, currency=currency)
+
+    def create_order(self, user, side, quantity, price=None, **fields):
+        return Order.objects.create(
+            user=user, type=side, base_currency=self.btc, quote_currency=self.inr,
+            price=Decimal(price) if price else None, quantity=Decimal(quantity), remaining_quantity=Decimal(quantity),
+            **fields
+        )
+
+    def rounded(self, value):
+        # How Settlement rounds each notional and fee.
+        return value.quantize(fixedpoint.QUANTUM, rounding=ROUND_HALF_EVEN)
+
+
+class HotQueryIndexTests(TestCase):
+    """The live-book and trade-history queries must be served by an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='trader', email='trader@example.com')
+        cls.btc = Currency.objects.create(name='Bitcoin', symbol='BTC')
+        cls.inr = Currency.objects.create(name='Indian Rupee', symbol='INR', is_crypto=False)
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be sequentially scanned.
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan TO off')
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+
+    def test_open_book_uses_book_index(self):
+        # SQLite cannot match a partial index's condition against bound
+        # parameters, so it settles for the full composite index.
+        self.assertUsesIndex(resting_orders(self.btc.id, self.inr.id), 'order_open_book_idx', 'order_pair_book_idx')
+
+    def test_buyer_history_uses_index(self):
+        self.assertUsesIndex(Trade.objects.filter(buyer=self.user).order_by('-traded_at'), 'trade_buyer_time_idx')
+
+    def test_seller_history_uses_index(self):
+        self.assertUsesIndex(Trade.objects.filter(seller=self.user).order_by('-traded_at'), 'trade_seller_time_idx')
+
+    def test_pair_history_uses_index(self):
+        trades = Trade.objects.filter(base_currency=self.btc, quote_currency=self.inr).order_by('traded_at')
+        self.assertUsesIndex(trades, 'trade_pair_time_idx')
+
+    def test_queue_uses_pending_index(self):
+        pending = OrderEvent.objects.filter(processed_at=None, failed_at=None)
+        self.assertUsesIndex(pending.values_list('base_currency_id', 'quote_currency_id').distinct(), 'orderevent_pending_idx')
+        self.assertUsesIndex(pending.filter(base_currency=self.btc, quote_currency=self.inr).order_by('id'), 'orderevent_pending_idx')
+
+
+class FixedPointTests(SimpleTestCase):
+    """The integer core must round exactly like quantizing the Decimal product."""
+
+    def reference(self, *factors):
+        product = Decimal(1)
+        for factor in factors:
+            product *= factor
+        return product.quantize(fixedpoint.QUANTUM, rounding=ROUND_HALF_EVEN)
+
+    def test_round_trip(self):
+        for value in ['0', '0.00000001', '1', '123456789012.12345678', '-5.5']:
+            self.assertEqual(fixedpoint.to_decimal(fixedpoint.to_units(Decimal(value))), Decimal(value))
+
+    def test_ties_round_to_even(self):
+        self.assertEqual(fixedpoint.round_div(5, 2), 2)
+        self.assertEqual(fixedpoint.round_div(7, 2), 4)
+        self.assertEqual(fixedpoint.round_div(-5, 2), -2)
+        self.assertEqual(fixedpoint.round_div(-7, 2), -4)
+        self.assertEqual(fixedpoint.round_div(6, 4), 2)
+
+    def test_products_match_decimal(self):
+        rng = random.Random(20240801)
+        for _ in range(2000):
+            price = Decimal(rng.randint(1, 10 ** 14)).scaleb(-8)
+            quantity = Decimal(rng.randint(1, 10 ** 12)).scaleb(-8)
+            fee = Decimal(rng.randint(0, 99999)).scaleb(-4) / 100
+            units = [fixedpoint.to_units(value) for value in (price, quantity, fee)]
+            self.assertEqual(fixedpoint.to_decimal(fixedpoint.mul(*units[:2])), self.reference(price, quantity))
+            self.assertEqual(fixedpoint.to_decimal(fixedpoint.mul(*units)), self.reference(price, quantity, fee))
+
+
+class OrderBookTests(SimpleTestCase):
+    """Price-time priority, partial fills and level bookkeeping of the in-memory book."""
+
+    def setUp(self):
+        self.book = OrderBook(1, 2)
+        self.ids = iter(range(1, 100))
+
+    def order(self, side, price, quantity):
+        return BookOrder(next(self.ids), 1, side, price, quantity, 0)
+
+    def rest(self, side, price, quantity):
+        order = self.order(side, price, quantity)
+        self.book.add(order)
+        return order
+
+    def fills(self, fills):
+        return [(fill.maker.id, fill.price, fill.quantity) for fill in fills]
+
+    def test_fifo_within_a_level(self):
+        first = self.rest('sell', 100, 2)
+        second = self.rest('sell', 100, 2)
+        fills = self.book.match(self.order('buy', 100, 3))
+        self.assertEqual(self.fills(fills), [(first.id, 100, 2), (second.id, 100, 1)])
+        self.assertEqual(list(self.book.orders), [second.id])
+
+    def test_partial_fill_of_maker_and_taker(self):
+        maker = self.rest('buy', 100, 5)
+        taker = self.order('sell', 99, 2)
+        self.assertEqual(self.fills(self.book.match(taker)), [(maker.id, 100, 2)])
+        self.assertEqual((taker.remaining, maker.remaining), (0, 3))
+        self.assertEqual(self.book.bids.depth(5), [(100, 3)])
+
+        taker = self.order('sell', 100, 4)
+        self.assertEqual(self.fills(self.book.match(taker)), [(maker.id, 100, 3)])
+        self.assertEqual(taker.remaining, 1)
+
+    def test_empty_levels_are_removed(self):
+        self.rest('sell', 100, 1)
+        self.rest('sell', 101, 1)
+        list(self.book.match(self.order('buy', 100, 1)))
+        self.assertEqual(self.book.asks.prices, [101])
+        self.assertNotIn(100, self.book.asks.levels)
+        self.assertEqual(self.book.best_ask, 101)
+
+    def test_best_prices_after_cancel(self):
+        bid = self.rest('buy', 99, 1)
+        self.rest('buy', 98, 1)
+        ask = self.rest('sell', 101, 1)
+        self.rest('sell', 101, 1)
+        self.assertEqual((self.book.best_bid, self.book.best_ask), (99, 101))
+        self.assertIs(self.book.remove(bid.id), bid)
+        self.assertIs(self.book.remove(ask.id), ask)
+        self.assertIsNone(self.book.remove(bid.id))
+        self.assertEqual((self.book.best_bid, self.book.best_ask), (98, 101))
+        self.assertEqual(self.book.asks.depth(5), [(101, 1)])
+
+    def test_crosses_several_levels_up_to_the_limit(self):
+        for price in (103, 100, 102, 101):
+            self.rest('sell', price, 1)
+        sequence = self.book.sequence
+        taker = self.order('buy', 102, 5)
+        self.assertEqual([fill.price for fill in self.book.match(taker)], [100, 101, 102])
+        self.assertEqual(taker.remaining, 2)
+        self.assertEqual(self.book.asks.depth(5), [(103, 1)])
+        self.assertGreater(self.book.sequence, sequence)
+        self.assertEqual(list(self.book.match(self.order('buy', 102, 1))), [])
+
+    def test_taker_remaining_reflects_each_fill_as_it_is_yielded(self):
+        self.rest('sell', 100, 1)
+        self.rest('sell', 101, 1)
+        taker = self.order('buy', 101, 3)
+        self.assertEqual([taker.remaining for _ in self.book.match(taker)], [2, 1])
+
+
+class SettlementRoundingTests(TradingPairMixin, TestCase):
+    """Persisted fills equal the Decimal computation under the documented rounding rule."""
+
+    def test_fill_matches_decimal_reference(self):
+        self.charge('0.1234', '0.3333')
+        self.fund(self.buyer, self.inr, '1000')
+        self.fund(self.seller, self.btc, '10')
+        price, quantity = '0.33333333', '3.00000007'
+        self.create_order(self.seller, Order.OrderType.SELL, quantity, price)
+        buy = self.create_order(self.buyer, Order.OrderType.BUY, quantity, price)
+        engine.match_orders()
+
+        notional = Decimal(price) * Decimal(quantity)
+        value = self.rounded(notional)
+        fee_buyer = self.rounded(notional * Decimal('0.3333') / 100)
+        fee_seller = self.rounded(notional * Decimal('0.1234') / 100)
+        trade = Trade.objects.get()
+        self.assertEqual((trade.fee_buyer, trade.fee_seller), (fee_buyer, fee_seller))
+
+        buy.refresh_from_db()
+        self.assertEqual(buy.status, Order.OrderStatus.EXECUTED)
+        self.assertEqual(self.balance(self.seller, self.inr), (value - fee_seller, 0))
+        self.assertEqual(self.balance(self.buyer, self.inr), (Decimal('1000') - value - fee_buyer, 0))
+
+    def test_partial_fills_stay_within_lock(self):
+        # Each fill rounds its notional and fee on its own; together they must not outrun the lock.
+        self.charge('0.1', '0.1')
+        price = '12.34567891'
+        buy = Order(user=self.buyer, type='buy', base_currency=self.btc, quote_currency=self.inr, price=Decimal(price), quantity=Decimal('1'))
+        self.fund(self.buyer, self.inr, orders.funds_to_lock(buy)[1])
+        self.fund(self.seller, self.btc, '1')
+
+        buy = self.create_order(self.buyer, Order.OrderType.BUY, '1', price)
+        engine.match_orders()
+        for _ in range(2):
+            self.create_order(self.seller, Order.OrderType.SELL, '0.5', price)
+            engine.match_orders()
+
+        buy.refresh_from_db()
+        self.assertEqual(buy.status, Order.OrderStatus.EXECUTED)
+        self.assertFalse(OrderEvent.objects.filter(processed_at=None).exists())
+        trades = Trade.objects.all()
+        self.assertTrue(all(trade.fee_buyer >= 0 for trade in trades))
+        available, locked = self.balance(self.buyer, self.inr)
+        self.assertEqual(locked, 0)
+        self.assertGreaterEqual(available, 0)
+        self.assertEqual(
+            orders.funds_to_lock(buy)[1] - available,
+            sum(self.rounded(trade.price * trade.quantity) + trade.fee_buyer for trade in trades),
+        )
+
+    def test_rounding_overrun_without_fees_is_paid_not_credited(self):
+        # Two fills of 1.5e-8 INR each round up to 2e-8, one unit more than the order locked.
+        self.fund(self.buyer, self.inr, '1')
+        self.fund(self.seller, self.btc, '1')
+        buy = self.create_order(self.buyer, Order.OrderType.BUY, '0.00000002', '1.5')
+        self.assertEqual(buy.locked_funds, Decimal('0.00000003'))
+        engine.match_orders()
+        for _ in range(2):
+            self.create_order(self.seller, Order.OrderType.SELL, '0.00000001', '1.5')
+            engine.match_orders()
+
+        self.assertEqual(list(Trade.objects.values_list('fee_buyer', flat=True)), [0, 0])
+        self.assertEqual(self.balance(self.buyer, self.inr), (Decimal('1') - Decimal('0.00000004'), 0))
+        self.assertEqual(self.balance(self.seller, self.inr), (Decimal('0.00000004'), 0))
+
+
+class MarketOrderTests(TradingPairMixin, TestCase):
+    """Market orders sweep the book within their budget; what they cannot fill is cancelled and released."""
+
+    taker_fee = Decimal('0.2')
+
+    def setUp(self):
+        super().setUp()
+        self.charge('0.1', self.taker_fee)
+        LastTradedPrice.objects.create(base_currency=self.btc, quote_currency=self.inr, price=Decimal('100'))
+        self.fund(self.buyer, self.inr, '1000')
+        self.fund(self.seller, self.btc, '10')
+
+    def place(self, user, side, quantity, price=None, execution_type=Order.ExecutionType.LIMIT):
+        order = self.create_order(user, side, quantity, price, execution_type=execution_type)
+        engine.match_orders()
+        order.refresh_from_db()
+        return order
+
+    def assertBuyerPaidForTrades(self):
+        # The buyer took every trade: it paid each notional plus the taker fee on it, and nothing else.
+        trades = Trade.objects.all()
+        for trade in trades:
+            self.assertGreaterEqual(trade.fee_buyer, 0)
+            self.assertGreaterEqual(trade.fee_seller, 0)
+        cost = sum(
+            self.rounded(trade.price * trade.quantity) + self.rounded(trade.price * trade.quantity * self.taker_fee / 100)
+            for trade in trades
+        )
+        self.assertEqual(self.balance(self.buyer, self.inr), (Decimal('1000') - cost, 0))
+
+    def test_market_buy_sweeps_levels_and_releases_unspent_lock(self):
+        for price in ('100', '101', '103'):
+            self.place(self.seller, Order.OrderType.SELL, '1', price)
+        buy = self.place(self.buyer, Order.OrderType.BUY, '2', execution_type=Order.ExecutionType.MARKET)
+        self.assertEqual(list(Trade.objects.order_by('id').values_list('price', 'quantity')), [(Decimal('100'), 1), (Decimal('101'), 1)])
+        self.assertEqual((buy.status, buy.remaining_quantity, buy.locked_funds), (Order.OrderStatus.EXECUTED, 0, 0))
+        self.assertBuyerPaidForTrades()
+        self.assertEqual(self.balance(self.buyer, self.btc), (Decimal('2'), 0))
+
+    def test_market_buy_stops_when_budget_runs_out(self):
+        for price in ('100', '101', '115'):
+            self.place(self.seller, Order.OrderType.SELL, '1', price)
+        # Budgeted at 105 per unit: the first two levels leave too little for a whole unit at 115.
+        buy = self.place(self.buyer, Order.OrderType.BUY, '3', execution_type=Order.ExecutionType.MARKET)
+        trades = list(Trade.objects.order_by('id'))
+        self.assertEqual([trade.price for trade in trades], [Decimal('100'), Decimal('101'), Decimal('115')])
+        self.assertTrue(0 < trades[-1].quantity < 1)
+        self.assertEqual(buy.status, Order.OrderStatus.CANCELLED)
+        self.assertEqual(buy.remaining_quantity, 1 - trades[-1].quantity)
+        self.assertEqual(buy.locked_funds, 0)
+        self.assertBuyerPaidForTrades()
+        self.assertEqual(engine.book(self.btc.id, self.inr.id).best_ask, fixedpoint.to_units(Decimal('115')))
+
+    def test_market_buy_budget_fills_whole_lots(self):
+        TradingPair.objects.create(base_currency=self.btc, quote_currency=self.inr, lot_size=Decimal('0.01'))
+        for price in ('100', '101', '115'):
+            self.place(self.seller, Order.OrderType.SELL, '1', price)
+        # 114.228 left at 115 plus fee buys 0.9913 BTC, rounded down to the lot.
+        buy = self.place(self.buyer, Order.OrderType.BUY, '3', execution_type=Order.ExecutionType.MARKET)
+        self.assertEqual(Trade.objects.order_by('-id').values_list('quantity', flat=True).first(), Decimal('0.99'))
+        self.assertEqual(buy.remaining_quantity, Decimal('0.01'))
+        self.assertBuyerPaidForTrades()
+
+    def test_limit_buy_sweeping_levels_settles_every_fill(self):
+        self.place(self.seller, Order.OrderType.SELL, '1', '100')
+        self.place(self.seller, Order.OrderType.SELL, '1', '101')
+        buy = self.place(self.buyer, Order.OrderType.BUY, '1.5', '101')
+        trades = list(Trade.objects.order_by('id'))
+        self.assertEqual([(trade.price, trade.quantity) for trade in trades], [(Decimal('100'), 1), (Decimal('101'), Decimal('0.5'))])
+        self.assertEqual([trade.fee_buyer for trade in trades], [Decimal('0.2'), Decimal('0.101')])
+        self.assertEqual((buy.status, buy.remaining_quantity, buy.locked_funds), (Order.OrderStatus.EXECUTED, 0, 0))
+        self.assertBuyerPaidForTrades()
+        self.assertEqual(self.balance(self.seller, self.inr), (Decimal('150.5') - Decimal('0.1505'), 0))
+
+    def test_deep_sweep_settles_in_fixed_statements(self):
+        for level in range(50):
+            self.create_order(self.seller, Order.OrderType.SELL, '0.1', Decimal(100) + level / Decimal(10))
+        engine.match_orders()
+        buy = self.create_order(self.buyer, Order.OrderType.BUY, '5', '105')
+        # Savepoint, queue read and update, trade, user trade and candle writes, order and balance
+        # updates, release: none repeat per fill, except that SQLite's parameter limit splits
+        # the 100 user trade rows into two inserts.
+        with self.assertNumQueries(11 if connection.vendor == 'sqlite' else 10):
+            engine.match_orders()
+        self.assertEqual(Trade.objects.filter(buy_order_id=buy.id).count(), 50)
+        self.assertBuyerPaidForTrades()
+
+    def test_market_sell_remainder_is_cancelled(self):
+        self.place(self.buyer, Order.OrderType.BUY, '1', '99')
+        sell = self.place(self.seller, Order.OrderType.SELL, '3', execution_type=Order.ExecutionType.MARKET)
+        self.assertEqual(list(Trade.objects.values_list('price', 'quantity')), [(Decimal('99'), 1)])
+        self.assertEqual((sell.status, sell.remaining_quantity, sell.locked_funds), (Order.OrderStatus.CANCELLED, 2, 0))
+        self.assertEqual(self.balance(self.seller, self.btc), (Decimal('9'), 0))
+        self.assertIsNone(engine.book(self.btc.id, self.inr.id).best_bid)
+
+
+class MatcherWorkerTests(TradingPairMixin, TestCase):
+    """An event that cannot be applied is parked; the rest of its batch still goes through."""
+
+    def test_poison_event_is_parked(self):
+        self.fund(self.seller, self.btc, '2')
+        poison = self.create_order(self.seller, Order.OrderType.SELL, '1', execution_type=Order.ExecutionType.MARKET)
+        # Releasing more than the balance has locked breaks its constraint.
+        Order.objects.filter(id=poison.id).update(locked_funds=Decimal('5'))
+        good = self.create_order(self.seller, Order.OrderType.SELL, '1', '100')
+
+        with self.assertLogs('backend', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(MatcherWorker().run_once(), 2)
+
+        event = OrderEvent.objects.get(order=poison)
+        self.assertIsNotNone(event.failed_at)
+        self.assertIn('IntegrityError', event.error)
+        self.assertIsNotNone(OrderEvent.objects.get(order=good).processed_at)
+        self.assertEqual(list(engine.book(self.btc.id, self.inr.id).orders), [good.id])
+        self.assertEqual(MatcherWorker().run_once(), 0)
+
+        call_command('prune_events', hours=0, batch_size=1, stdout=StringIO())
+        self.assertEqual(list(OrderEvent.objects.values_list('order_id', flat=True)), [poison.id])
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    """A separate run_matcher needs a cache it shares with the web processes."""
+
+    def test_process_local_cache_needs_inline_matching(self):
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+        with override_settings(MATCHER_INLINE=False):
+            self.assertEqual([error.id for error in checks.shared_cache_errors()], ['backend.E001'])
+            with override_settings(CACHES=redis):
+                self.assertEqual(checks.shared_cache_errors(), [])
+        with override_settings(MATCHER_INLINE=True):
+            self.assertEqual(checks.shared_cache_errors(), [])
+
+
+class OrderCancelTests(TradingPairMixin, TestCase):
+    """Open orders are only removed by cancelling them through the matcher, which releases their funds once."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.buyer
+        self.user.is_staff = True
+        self.user.save()
+        self.user.user_permissions.set(Permission.objects.filter(content_type__app_label='backend', codename__endswith='_order'))
+        self.fund(self.user, self.inr, '1000')
+        self.client.force_login(self.user)
+
+    def place(self, price='100', quantity='1'):
+        return self.create_order(self.user, Order.OrderType.BUY, quantity, price)
+
+    def test_placed_orders_cannot_be_edited_or_deleted(self):
+        order = self.place()
+        change = self.client.post(reverse('admin:backend_order_change', args=[order.id]), {'price': '1'})
+        self.assertEqual(change.status_code, 403)
+        delete = self.client.post(reverse('admin:backend_order_delete', args=[order.id]), {'post': 'yes'})
+        self.assertEqual(delete.status_code, 403)
+        changelist = self.client.get(reverse('admin:backend_order_changelist'))
+        self.assertEqual(changelist.status_code, 200)
+        self.assertEqual([name for name, _ in changelist.context['action_form'].fields['action'].choices if name], ['cancel_orders'])
+        order.refresh_from_db()
+        self.assertEqual((order.price, order.status), (Decimal('100'), Order.OrderStatus.PENDING))
+
+    def assertAllReleased(self, spent=0):
+        self.assertEqual(self.balance(self.user, self.inr), (Decimal('1000') - spent, 0))
+
+    def test_cancel_action_refunds_in_bulk(self):
+        placed = [self.place(price) for price in ('100', '99', '98')]
+        engine.match_orders()
+        kept = self.place('97')
+        response = self.client.post(reverse('admin:backend_order_changelist'), {
+            'action': 'cancel_orders', '_selected_action': [order.id for order in placed],
+        })
+        self.assertEqual(response.status_code, 302)
+        engine.match_orders()
+        self.assertEqual(
+            dict(Order.objects.values_list('id', 'status')),
+            {**{order.id: Order.OrderStatus.CANCELLED for order in placed}, kept.id: Order.OrderStatus.PENDING},
+        )
+        orders.cancel(self.user, pair=(self.btc.id, self.inr.id))
+        engine.match_orders()
+        self.assertAllReleased()
+
+    def test_closed_orders_are_not_cancelled_again(self):
+        self.fund(self.seller, self.btc, '1')
+        filled, cancelled = self.place(), self.place('99')
+        engine.match_orders()
+        self.assertEqual(orders.cancel(self.user, order_ids=[cancelled.id]), [cancelled.id])
+        engine.match_orders()
+        # The sell fills `filled` before the cancellation queued behind it is applied.
+        sell = self.create_order(self.seller, Order.OrderType.SELL, '1', '100')
+        self.assertEqual(orders.cancel_orders(self.user, order_ids=[filled.id]), [filled.id])
+        engine.match_orders()
+        self.assertEqual(orders.cancel(self.user, order_ids=[filled.id, cancelled.id]), [])
+        engine.match_orders()
+        self.assertEqual(
+            dict(Order.objects.values_list('id', 'status')),
+            {filled.id: Order.OrderStatus.EXECUTED, cancelled.id: Order.OrderStatus.CANCELLED, sell.id: Order.OrderStatus.EXECUTED},
+        )
+        self.assertAllReleased(spent=Decimal('100'))
+
+
+class MarketDepthTests(TradingPairMixin, TestCase):
+    """Depth is served from the published snapshot, clamped to what it holds, with sequences that never go back."""
+
+    def book(self, *levels):
+        book = OrderBook(self.btc.id, self.inr.id)
+        for id, (side, price, quantity) in enumerate(levels, 1):
+            book.add(BookOrder(id, self.buyer.id, side, fixedpoint.to_units(price), fixedpoint.to_units(quantity), 0))
+        return book
+
+    def test_publish_depth_diffs_against_previous_snapshot(self):
+        book = self.book(('buy', 99, 1), ('buy', 98, 2), ('sell', 101, 3))
+        first = marketdata.publish_depth(book)
+        self.assertEqual(
+            (first['prev_sequence'], first['bids'], first['asks']),
+            (None, [['99.00000000', '1.00000000'], ['98.00000000', '2.00000000']], [['101.00000000', '3.00000000']]),
+        )
+        book.update(1, fixedpoint.to_units('0.5'), 0)
+        book.remove(3)
+        second = marketdata.publish_depth(book)
+        self.assertEqual((second['sequence'], second['prev_sequence']), (book.sequence, first['sequence']))
+        self.assertGreater(second['sequence'], first['sequence'])
+        self.assertEqual(second['bids'], [['99.00000000', '0.50000000']])
+        self.assertEqual(second['asks'], [['101.00000000', '0']])
+
+    def test_get_depth_and_view_clamp_levels(self):
+        marketdata.publish_depth(self.book(('buy', 99, 1), ('buy', 98, 1), ('buy', 97, 1), ('sell', 101, 1)))
+        self.assertEqual(len(marketdata.get_depth('BTC-INR', 2)['bids']), 2)
+        self.assertIsNone(marketdata.get_depth('ETH-INR'))
+        url = reverse('depth', args=['btc-inr'])
+        for levels, bids in [('2', 2), ('0', 1), ('-5', 1), (str(marketdata.DEPTH_LEVELS * 10), 3)]:
+            with self.subTest(levels=levels):
+                response = self.client.get(url, {'levels': levels})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual((len(response.json()['bids']), len(response.json()['asks'])), (bids, 1))
+        self.assertEqual(self.client.get(url, {'levels': 'all'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('depth', args=['eth-inr'])).status_code, 404)
+
+    def test_sequence_continues_across_book_reload(self):
+        self.fund(self.buyer, self.inr, '1000')
+        self.fund(self.seller, self.btc, '1')
+
+        def place(user, side, price):
+            self.create_order(user, side, '0.1', price)
+            with self.captureOnCommitCallbacks(execute=True):
+                engine.match_orders()
+            return marketdata.get_events('BTC-INR', 0)[1][-1]
+
+        before = place(self.buyer, Order.OrderType.BUY, '99')
+        engine.reset()
+        after = place(self.seller, Order.OrderType.SELL, '101')
+        self.assertEqual(after['prev_sequence'], before['sequence'])
+        self.assertGreater(after['sequence'], before['sequence'])
+        self.assertEqual(marketdata.get_depth('BTC-INR')['sequence'], after['sequence'])
+        self.assertEqual(after['asks'], [['101.00000000', '0.10000000']])
+
+
+class MarketDataStreamTests(SimpleTestCase):
+    """A subscriber gets a depth snapshot, then the pair's messages in order, and a resync after a gap."""
+
+    pair = 'BTC-INR'
+
+    def setUp(self):
+        cache.set(marketdata.depth_key(self.pair), {'pair': self.pair, 'sequence': 7, 'bids': [['100', '1']], 'asks': []})
+        marketdata.publish_events(self.pair, [{'type': 'ltp', 'price': '100'}])
+        self.addCleanup(cache.clear)
+        self.addCleanup(streaming.publisher.feeds.clear)
+
+    async def connect(self):
+        communicator = ApplicationCommunicator(
+            streaming.websocket_application, {'type': 'websocket', 'path': f'/ws/marketdata/{self.pair}/'},
+        )
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output())['type'], 'websocket.accept')
+        self.assertEqual(await self.receive(communicator), {'type': 'snapshot', 'pair': self.pair, 'sequence': 7, 'bids': [['100', '1']], 'asks': []})
+        # Anything published from here on is news to the feed.
+        feed = streaming.publisher.feed(self.pair)
+        while feed.last_id is None:
+            await asyncio.sleep(0.01)
+        return communicator
+
+    async def receive(self, communicator):
+        return json.loads((await communicator.receive_output(timeout=2))['text'])
+
+    async def test_snapshot_then_messages(self):
+        communicator = await self.connect()
+        await sync_to_async(marketdata.publish_events)(self.pair, [{'type': 'trade', 'price': '101'}, {'type': 'ltp', 'price': '101'}])
+        self.assertEqual(await self.receive(communicator), {'type': 'trade', 'price': '101', 'id': 2})
+        self.assertEqual(await self.receive(communicator), {'type': 'ltp', 'price': '101', 'id': 3})
+        await communicator.send_input({'type': 'websocket.send', 'text': '{"action": "snapshot"}'})
+        self.assertEqual((await self.receive(communicator))['type'], 'snapshot')
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait()
+
+    async def test_gap_triggers_resync(self):
+        communicator = await self.connect()
+        # More messages than the log keeps arrive between two polls.
+        await sync_to_async(marketdata.publish_events)(
+            self.pair, [{'type': 'trade', 'price': '101'} for _ in range(marketdata.EVENT_LOG_SIZE + 1)],
+        )
+        self.assertEqual(await self.receive(communicator), {'type': 'resync'})
+        self.assertEqual((await self.receive(communicator))['type'], 'snapshot')
+        await sync_to_async(marketdata.publish_events)(self.pair, [{'type': 'ltp', 'price': '102'}])
+        self.assertEqual(await self.receive(communicator), {'type': 'ltp', 'price': '102', 'id': marketdata.EVENT_LOG_SIZE + 3})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait()
+
+
+class CandleBackfillTests(TradingPairMixin, TestCase):
+    """backfill_candles rebuilds closed buckets from the trades and leaves the ones the matcher is writing alone."""
+
+    def test_rebuilds_only_closed_buckets(self):
+        now = timezone.now()
+        old, recent = [
+            Trade.objects.create(base_currency=self.btc, quote_currency=self.inr, price=Decimal(price), quantity=Decimal('1'))
+            for price in ('100', '105')
+        ]
+        Trade.objects.filter(id=old.id).update(traded_at=now - timedelta(days=2))
+        old.refresh_from_db()
+        # As the matcher left them: the old buckets are wrong, the open ones hold trades the backfill cannot see yet.
+        bars = candles.aggregate([old, recent])
+        for bar in bars.values():
+            bar.trades = 5
+        candles.save(bars)
+
+        call_command('backfill_candles', stdout=StringIO())
+        stored = {(candle.interval, candle.open_time): candle.trades for candle in Candle.objects.all()}
+        for interval in candles.INTERVALS:
+            self.assertEqual(stored[interval, candles.open_time(old.traded_at, interval)], 1)
+            self.assertEqual(stored[interval, candles.open_time(recent.traded_at, interval)], 5)
+
+
+class TickerTests(TradingPairMixin, TestCase):
+    """The 24h ticker only counts trades inside its window, and old ones age out as it slides."""
+
+    def test_trades_outside_window_drop_out(self):
+        now = timezone.now()
+        window = ticker.Ticker(self.btc.id, self.inr.id)
+        for price, quantity, hours_ago in [(90, 5, 25), (100, 1, 23), (110, 2, 1)]:
+            window.add(fixedpoint.to_units(price), fixedpoint.to_units(quantity), now - timedelta(hours=hours_ago))
+
+        ticker.publish([window])
+        stats, = ticker.get_all()
+        self.assertEqual(
+            {key: stats[key] for key in ('pair', 'open', 'high', 'low', 'last', 'volume', 'trades')},
+            {'pair': 'BTC-INR', 'open': '100.00000000', 'high': '110.00000000', 'low': '100.00000000',
+             'last': '110.00000000', 'volume': '3.00000000', 'trades': 2},
+        )
+        stats = window.stats(now + timedelta(hours=2))
+        self.assertEqual(
+            (stats['open'], stats['low'], stats['volume'], stats['trades']),
+            ('110.00000000', '110.00000000', '2.00000000', 1),
+        )
+
+
+class FeeScheduleTests(TradingPairMixin, TestCase):
+    """fees_for() reads this process' copy of the schedule and reloads it once a Charge changes."""
+
+    def fees(self):
+        return fees.fees_for(self.btc.id, self.inr.id)
+
+    def test_steady_state_costs_no_queries(self):
+        self.charge('0.1', '0.2')
+        self.fees()
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                self.assertEqual(self.fees(), (fixedpoint.to_units('0.001'), fixedpoint.to_units('0.002')))
+
+    def test_saving_or_deleting_a_charge_reloads(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            charge = Charge.objects.create(
+                base_currency=self.btc, quote_currency=self.inr, maker_fee=Decimal('0.1'), taker_fee=Decimal('0.2'),
+            )
+        self.fees()
+        version = cache.get('fees:version')
+        with self.captureOnCommitCallbacks(execute=True):
+            charge.taker_fee = Decimal('0.3')
+            charge.save()
+        self.assertNotEqual(cache.get('fees:version'), version)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.fees()[1], fixedpoint.to_units('0.003'))
+        with self.captureOnCommitCallbacks(execute=True):
+            charge.delete()
+        self.assertEqual(self.fees(), fees.ZERO_FEES)
+
+    def test_other_processes_reload_on_a_new_version(self):
+        self.charge('0.1', '0.2')
+        self.fees()
+        # What another process' invalidate() leaves behind, seen once the check interval has passed.
+        Charge.objects.update(taker_fee=Decimal('0.3'))
+        cache.set('fees:version', 'elsewhere')
+        fees._schedule.checked_at = time.monotonic()
+        self.assertEqual(self.fees()[1], fixedpoint.to_units('0.002'))
+        fees._schedule.checked_at = 0
+        with self.assertNumQueries(1):
+            self.assertEqual(self.fees()[1], fixedpoint.to_units('0.003'))
+
+
+class MetricsTests(TestCase):
+    """Metrics render in the Prometheus text format when enabled and cost nothing when not."""
+
+    def enable(self):
+        metrics.enabled = True
+        self.addCleanup(setattr, metrics, 'enabled', False)
+        self.addCleanup(metrics._counters.clear)
+        self.addCleanup(metrics._histograms.clear)
+
+    def lines(self, name):
+        return [line for line in metrics.render().splitlines() if line.startswith(name)]
+
+    def test_render_counters_and_histograms(self):
+        self.enable()
+        metrics.inc('matching_fills_total', 3)
+        metrics.inc('matching_phase_queries_total', 2, phase='ledger')
+        for value in (0, 3, 7):
+            metrics.observe('matching_fills_per_pass', value)
+        text = metrics.render()
+        self.assertIn('# HELP matching_fills_total Fills produced.\n# TYPE matching_fills_total counter\n', text)
+        self.assertEqual(self.lines('matching_fills_total'), ['matching_fills_total 3'])
+        self.assertEqual(self.lines('matching_phase_queries_total'), ['matching_phase_queries_total{phase="ledger"} 2'])
+        self.assertIn('# TYPE matching_fills_per_pass histogram', text)
+        buckets = ['0', '1', '5', '10', '50', '100', '500', '1000', '5000', '+Inf']
+        self.assertEqual(self.lines('matching_fills_per_pass'), [
+            *(f'matching_fills_per_pass_bucket{{le="{le}"}} {count}' for le, count in zip(buckets, [1, 1, 2, 3, 3, 3, 3, 3, 3, 3])),
+            'matching_fills_per_pass_sum 10',
+            'matching_fills_per_pass_count 3',
+        ])
+
+    def test_phases_and_passes(self):
+        self.enable()
+        with self.assertLogs('backend.metrics', 'INFO') as logs, metrics.matching_pass():
+            with metrics.phase('ledger'):
+                Currency.objects.count()
+            metrics.record(events=2, fills=1)
+        summary = json.loads(logs.records[0].getMessage())
+        self.assertEqual((summary['events'], summary['fills'], summary['queries']), (2, 1, {'ledger': 1, 'pass': 1}))
+        self.assertEqual(self.lines('matching_phase_queries_total'), [
+            'matching_phase_queries_total{phase="ledger"} 1', 'matching_phase_queries_total{phase="pass"} 1',
+        ])
+        self.assertEqual(self.lines('matching_phase_seconds_count'), [
+            'matching_phase_seconds_count{phase="ledger"} 1', 'matching_phase_seconds_count{phase="pass"} 1',
+        ])
+        self.assertEqual(self.lines('matching_passes_total'), ['matching_passes_total 1'])
+
+    def test_disabled_is_a_no_op(self):
+        self.assertFalse(metrics.enabled)
+        self.assertIs(metrics.phase('ledger'), metrics.matching_pass())
+        with metrics.matching_pass(), metrics.phase('ledger'):
+            metrics.inc('matching_fills_total')
+            metrics.observe('matching_fills_per_pass', 1)
+            metrics.record(fills=1)
+        self.assertTrue(all(line.startswith('#') for line in metrics.render().splitlines()))
+
+    def test_view_is_hidden_when_disabled(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.enable()
+        metrics.inc('matching_passes_total')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual((response.status_code, response['Content-Type']), (200, metrics.CONTENT_TYPE))
+        self.assertIn('matching_passes_total 1\n', response.content.decode())
+
+
+class MatchingBenchmarkTests(TestCase):
+    """The benchmark harness is reproducible and keeps the baseline comparable."""
+
+    def trades(self, prefix):
+        return list(
+            Trade.objects.filter(base_currency__symbol__startswith=prefix)
+            .order_by('id')
+            .values_list('price', 'quantity')
+        )
+
+    def test_flow_is_seeded(self):
+        self.assertEqual(bench.synthetic_flow(seed=7, orders=200), bench.synthetic_flow(seed=7, orders=200))
+        self.assertNotEqual(bench.synthetic_flow(seed=7, orders=200), bench.synthetic_flow(seed=8, orders=200))
+
+    def test_current_engine_is_deterministic(self):
+        flow = bench.synthetic_flow(seed=3, orders=60, pairs=2, depth=5)
+        first = bench.run(flow, prefix='RA')
+        second = bench.run(flow, prefix='RB')
+        self.assertEqual(first.orders, len(flow))
+        self.assertGreater(first.trades, 0)
+        self.assertEqual(self.trades('RA'), self.trades('RB'))
+
+    def test_reports_against_baseline(self):
+        flow = bench.synthetic_flow(seed=5, orders=40, depth=10, market_ratio=0)
+        current = bench.run(flow, prefix='CU')
+        baseline = bench.run(flow, baseline=True, prefix='BL')
+        self.assertEqual((current.engine, baseline.engine), ('current', 'baseline'))
+        self.assertEqual(baseline.orders, len(flow))
+        self.assertGreater(current.orders_per_second, 0)
+        self.assertLessEqual(current.p50_ms, current.p99_ms)
+        self.assertLess(current.queries_per_order, baseline.queries_per_order)
+
+
+@skipUnless(os.environ.get('BENCHMARKS') == '1', "Set BENCHMARKS=1 to run the matching benchmarks.")
+class MatchingThroughputTests(TestCase):
+    """Orders/sec and latency of the current engine on fixed flows; opt-in, as they take a while."""
+
+    flows = {
+        'mixed': dict(seed=1, orders=2000, depth=50),
+        'deep book': dict(seed=2, orders=1000, depth=200, market_ratio=0.3),
+        'four pairs': dict(seed=3, orders=2000, pairs=4, depth=20),
+    }
+
+    def test_fixed_flows(self):
+        self.addCleanup(engine.reset)
+        for number, (name, options) in enumerate(self.flows.items()):
+            with self.subTest(flow=name):
+                flow = bench.synthetic_flow(**options)
+                report = bench.run(flow, prefix=f'TP{number}')
+                sys.stderr.write(
+                    f"\n{name}: {report.orders_per_second:.1f} orders/s, p50 {report.p50_ms:.2f} ms, "
+                    f"p99 {report.p99_ms:.2f} ms, {report.queries_per_order:.1f} queries/order on {connection.vendor}"
+                )
+                self.assertEqual(report.orders + report.rejected, len(flow))
+                self.assertGreater(report.trades, 0)
+                self.assertLessEqual(report.p50_ms, report.p99_ms)
+
+
+@override_settings(MATCHER_JOURNAL_FSYNC=False)
+class MatchingJournalTests(TransactionTestCase):
+    """A book replayed from snapshot and journal equals the one loaded from the Order table."""
+    databases = '__all__'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        engine.journal = Journal(self.root, snapshot_interval=40)
+        self.addCleanup(setattr, engine, 'journal', None)
+        self.addCleanup(engine.reset)
+        # Unflushed LTPs of pairs another test created would not survive the table flush.
+        engine.last_prices = {}
+        self.addCleanup(setattr, engine, 'last_prices', {})
+
+    def orders(self, book):
+        return sorted((o.id, o.side, o.price, o.remaining, o.locked) for o in book.orders.values())
+
+    def test_replay_matches_order_table(self):
+        bench.run(bench.synthetic_flow(seed=4, orders=150, depth=10), prefix='JR')
+        pair = Currency.objects.get(symbol='JR0').id, Currency.objects.get(symbol='JRQ').id
+        in_memory = self.orders(engine.book(*pair))
+        engine.reset()
+        # Archiving and pruning remove queue rows; recovery must not depend on them.
+        OrderEvent.objects.all().delete()
+        replayed = self.orders(engine.book(*pair))
+        from_table = OrderBook(*pair)
+        engine._load(from_table)
+        self.assertEqual(replayed, in_memory)
+        self.assertEqual(replayed, self.orders(from_table))
+        files = os.listdir(os.path.join(self.root, f'{pair[0]}-{pair[1]}'))
+        self.assertEqual(len([name for name in files if name.startswith('snapshot-')]), 1)
+        self.assertGreater(len([name for name in files if name.startswith('journal-')]), 1)
+
+    def test_uncommitted_block_is_cut_off(self):
+        bench.run(bench.synthetic_flow(seed=5, orders=60, depth=10), prefix='JU')
+        pair = Currency.objects.get(symbol='JU0').id, Currency.objects.get(symbol='JUQ').id
+        book = engine.book(*pair)
+        in_memory = self.orders(book)
+        # A pass that wrote its block but died before its transaction committed.
+        journal = engine.journal.pair(book)
+        journal.add(CANCEL, next(iter(book.orders)))
+        journal.last_event_id = JournalCommit.objects.get(base_currency_id=pair[0], quote_currency_id=pair[1]).last_event_id + 1
+        journal.write()
+        size = os.path.getsize(journal._file_name('journal-', journal.segment))
+        engine.reset()
+        self.assertEqual(self.orders(engine.book(*pair)), in_memory)
+        self.assertLess(os.path.getsize(journal._file_name('journal-', journal.segment)), size)
+
+
+class LastPriceFlushTests(TradingPairMixin, TransactionTestCase):
+    """Write-behind LTPs reach the table without a worker loop, and before a terminated matcher exits."""
+
+    def setUp(self):
+        super().setUp()
+        self.fund(self.buyer, self.inr, '1000')
+        self.fund(self.seller, self.btc, '1')
+        engine.last_prices = {}
+        self.addCleanup(setattr, engine, 'last_prices', {})
+        self.addCleanup(ticker._tickers.clear)
+
+    def trade(self, price):
+        for user, side in ((self.seller, 'sell'), (self.buyer, 'buy')):
+            orders.submit_batch(user, place=[{'pair': 'BTC-INR', 'side': side, 'price': price, 'quantity': '0.1'}])
+
+    def stored_price(self):
+        return LastTradedPrice.objects.filter(base_currency=self.btc, quote_currency=self.inr).values_list('price', flat=True).first()
+
+    @override_settings(MATCHER_INLINE=True)
+    def test_inline_matching_flushes_on_a_timer(self):
+        engine.LTP_FLUSH_INTERVAL = 0.1
+        self.addCleanup(delattr, engine, 'LTP_FLUSH_INTERVAL')
+        # Just flushed, so the request itself leaves the new LTP in memory.
+        engine.last_prices_flushed_at = time.monotonic()
+        self.trade('100')
+        self.assertIsNone(self.stored_price())
+        deadline = time.monotonic() + 5
+        while self.stored_price() is None and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.stored_price(), Decimal('100'))
+
+    @override_settings(MATCHER_INLINE=True)
+    def test_sigterm_stops_the_matcher_after_a_flush(self):
+        self.addCleanup(signal.signal, signal.SIGTERM, signal.getsignal(signal.SIGTERM))
+        self.trade('100')
+        engine.last_prices[self.btc.id, self.inr.id] = Decimal('101')
+        threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM)).start()
+        out = StringIO()
+        call_command('run_matcher', stdout=out)
+        self.assertIn("Matcher stopped.", out.getvalue())
+        self.assertEqual(self.stored_price(), Decimal('101'))
+
+
+class TradeHistoryTests(TestCase):
+    """Keyset pages and the export cover exactly the user's trades as buyer or seller."""
+
+    def test_pages_and_export_match_trade_table(self):
+        bench.run(bench.synthetic_flow(seed=2, orders=200, depth=10), prefix='TH')
+        user = CustomUser.objects.get(username='th-1')
+        expected = list(
+            Trade.objects.filter(Q(buyer=user) | Q(seller=user)).order_by('-traded_at', '-id').values_list('id', flat=True)
+        )
+        seen, after = [], None
+        while True:
+            rows, after = history.page(history.history(user.id), after=after, limit=7)
+            seen += [row.trade_id for row in rows]
+            if after is None:
+                break
+        self.assertGreater(len(expected), 7)
+        # A self-trade has a row per side.
+        self.assertEqual(list(dict.fromkeys(seen)), expected)
+        lines = list(history.export(history.history(user.id).reverse(), 'csv', chunk_size=5))
+        self.assertEqual(lines[0].strip(), ','.join(history.EXPORT_FIELDS))
+        self.assertEqual(len(lines) - 1, history.history(user.id).count())
+
+    async def test_export_view_streams_asynchronously(self):
+        await sync_to_async(bench.run)(bench.synthetic_flow(seed=2, orders=60, depth=5), prefix='TA')
+        user = await CustomUser.objects.aget(username='ta-1')
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get(reverse('trade-export'), {'format': 'ndjson'})
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertTrue(rows)
+        self.assertEqual([row['trade_id'] for row in rows], [
+            row.trade_id async for row in history.history(user.id).reverse()
+        ])
+
+
+class OrderArchiveTests(TestCase):
+    """archive_orders moves only closed orders and leaves trades pointing at their ids."""
+
+    def test_moves_closed_orders_in_batches(self):
+        bench.run(bench.synthetic_flow(seed=2, orders=100, depth=5), prefix='AO')
+        open_ids = set(Order.objects.filter(status__in=['pending', 'partial']).values_list('id', flat=True))
+        closed_ids = set(Order.objects.filter(status__in=['executed', 'cancelled']).values_list('id', flat=True))
+        trades = list(Trade.objects.values_list('id', 'buy_order_id', 'sell_order_id'))
+        call_command('archive_orders', days=0, batch_size=7, stdout=StringIO())
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), open_ids)
+        self.assertEqual(set(OrderArchive.objects.values_list('id', flat=True)), closed_ids)
+        self.assertEqual(list(Trade.objects.values_list('id', 'buy_order_id', 'sell_order_id')), trades)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Reference and history reads go to a replica; the ledger, orders and writes stay on the primary."""
+    databases = {'default'}
+
+    def test_routes_reads(self):
+        router = ReplicaRouter()
+        for model in (Trade, UserTrade, LastTradedPrice, Currency):
+            self.assertEqual(router.db_for_read(model), 'replica1')
+            self.assertEqual(router.db_for_write(model), 'default')
+        for model in (Balance, Order, CustomUser):
+            self.assertEqual(router.db_for_read(model), 'default')
+
+    def test_reads_in_a_transaction_stay_on_primary(self):
+        router = ReplicaRouter()
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Trade), 'default')
+
+    def test_registry_and_fees_reload_from_primary(self):
+        # 'replica1' has no connection here, so any read routed to it would raise.
+        pairs.reset()
+        fees.invalidate()
+        self.addCleanup(cache.clear)
+        pairs.pair_ids('BTC-INR')
+        fees.fees_for(1, 2)
+
+
+class PairRegistryTests(TradingPairMixin, TestCase):
+    """Pair lookups come from the process-wide registry, which follows Currency and TradingPair changes."""
+
+    def test_lookups_and_invalidation(self):
+        self.assertEqual(pairs.pair_ids('btc-inr'), (self.btc.id, self.inr.id))
+        with self.assertNumQueries(0):
+            self.assertEqual(pairs.pair_symbol(self.btc.id, self.inr.id), 'BTC-INR')
+            self.assertEqual(pairs.get(self.btc.id, self.inr.id).tick_size, 1)
+
+        pair = TradingPair.objects.create(base_currency=self.btc, quote_currency=self.inr, tick_size=Decimal('0.5'), active=False)
+        self.assertEqual(pairs.get(self.btc.id, self.inr.id).tick_size, 50000000)
+        order = orders.build_order(self.buyer, {'pair': 'BTC-INR', 'side': 'buy', 'price': '100', 'quantity': '1'})
+        with self.assertRaises(orders.InvalidOrder):
+            orders.check_rules(order)
+        pair.active = True
+        pair.save()
+        orders.check_rules(order)
+
+
+@override_settings(PRICE_BAND='0.1', MAX_OPEN_ORDERS=2)
+class PreTradeValidationTests(TradingPairMixin, TestCase):
+    """Orders breaking a pair rule, the price band, the open-order limit or the balance are never inserted."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.buyer
+        TradingPair.objects.create(
+            base_currency=self.btc, quote_currency=self.inr,
+            tick_size=Decimal('0.5'), lot_size=Decimal('0.01'), min_notional=Decimal('10'),
+        )
+        LastTradedPrice.objects.create(base_currency=self.btc, quote_currency=self.inr, price=Decimal('100'))
+        self.fund(self.user, self.inr, '1000')
+
+    def place(self, price, quantity):
+        spec = {'pair': 'BTC-INR', 'side': 'buy', 'price': price, 'quantity': quantity}
+        return orders.submit_batch(self.user, place=[spec])
+
+    def test_rejects_before_insert(self):
+        for price, quantity, error in [
+            ('100.3', '1', orders.InvalidOrder),  # tick size
+            ('100', '1.005', orders.InvalidOrder),  # lot size
+            ('100', '0.05', orders.InvalidOrder),  # min notional, after reading and caching the LTP
+            ('111', '1', orders.InvalidOrder),  # price band
+            ('100', '11', InsufficientBalance),
+        ]:
+            with self.subTest(price=price, quantity=quantity), self.assertRaises(error):
+                self.place(price, quantity)
+        # Order.save() only opens its transaction (a savepoint inside the test's).
+        with CaptureQueriesContext(connection) as queries, self.assertRaises(orders.InvalidOrder):
+            self.create_order(self.user, Order.OrderType.BUY, '1', '50')
+        self.assertTrue(all('SAVEPOINT' in query['sql'] for query in queries), queries.captured_queries)
+        self.assertFalse(Order.objects.exists())
+
+    def test_create_reserves_before_insert(self):
+        order = self.create_order(self.user, Order.OrderType.BUY, '2', '100')
+        self.assertEqual(Order.objects.values_list('locked_funds', flat=True).get(id=order.id), Decimal('200'))
+        self.assertEqual(self.balance(self.user, self.inr), (Decimal('800'), Decimal('200')))
+        self.assertTrue(OrderEvent.objects.filter(order=order).exists())
+        with self.assertRaises(InsufficientBalance):
+            self.create_order(self.user, Order.OrderType.BUY, '9', '100')
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [order.id])
+
+    def test_open_order_limit(self):
+        self.place('100', '1')
+        self.place('99.5', '1')
+        with self.assertRaises(orders.InvalidOrder):
+            self.place('99', '1')
+        self.assertEqual(Order.objects.count(), 2)
+
+    @override_settings(MAX_OPEN_ORDERS=10)
+    def test_batch_is_all_or_nothing(self):
+        resting, = self.place('100', '1')[0]
+        before = list(Balance.objects.order_by('id').values_list('available', 'locked'))
+        spec = {'pair': 'BTC-INR', 'side': 'buy', 'quantity': '1'}
+        for bad, error in [
+            (dict(spec, price='99.3'), orders.InvalidOrder),  # fails its pair rules
+            (dict(spec, price='110', quantity='8'), InsufficientBalance),  # fits alone, not with the others
+        ]:
+            batch = [dict(spec, price='99'), dict(spec, price='99.5'), bad]
+            with self.subTest(bad=bad), self.assertRaises(error):
+                orders.submit_batch(self.user, place=batch, cancel=[resting.id])
+            self.assertEqual(list(Order.objects.values_list('id', flat=True)), [resting.id])
+            self.assertEqual(list(OrderEvent.objects.values_list('type', flat=True)), [OrderEvent.EventType.PLACE])
+            self.assertEqual(list(Balance.objects.order_by('id').values_list('available', 'locked')), before)
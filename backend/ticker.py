@@ -0,0 +1,183 @@
+"""
+Rolling 24h ticker per pair, kept by the pair's matcher.
+
+The window is a queue of one-minute buckets, seeded from the 1m candles
+when the pair's book is loaded and advanced with every committed trade,
+so the Trade table is never aggregated. Readers get the last published
+stats from the cache.
+"""
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import candles, marketdata, pairs
+from .fixedpoint import SCALE, mul, round_div, to_decimal, to_units
+from .models import Candle
+
+WINDOW = timedelta(hours=24)
+BUCKET = Candle.Interval.ONE_MINUTE
+# How often an idle matcher republishes its tickers so old buckets age out.
+REFRESH_INTERVAL = 5.0
+
+PAIRS_KEY = 'marketdata:ticker:pairs'
+
+_tickers = {}
+_refreshed_at = 0.0
+
+
+def ticker_key(pair):
+    return f'marketdata:ticker:{pair}'
+
+
+class Bucket:
+    __slots__ = ('open_time', 'open', 'high', 'low', 'close', 'volume', 'quote_volume', 'trades')
+
+    def __init__(self, open_time, open, high, low, close, volume, quote_volume, trades):
+        self.open_time = open_time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.quote_volume = quote_volume
+        self.trades = trades
+
+
+class Ticker:
+    """
+    24h stats of one pair in integer units. Volumes are running sums; high
+    and low are taken over the (at most 1440) buckets when published. The
+    window start moves a minute at a time.
+    """
+
+    def __init__(self, base_currency_id, quote_currency_id, last_price=None):
+        self.base_currency_id = base_currency_id
+        self.quote_currency_id = quote_currency_id
+        self.buckets = deque()
+        self.last_price = last_price
+        self.volume = 0
+        self.quote_volume = 0
+        self.trades = 0
+
+    def add(self, price, quantity, timestamp):
+        open_time = candles.open_time(timestamp, BUCKET)
+        notional = mul(price, quantity)
+        bucket = self.buckets[-1] if self.buckets else None
+        if bucket is None or bucket.open_time != open_time:
+            self._append(Bucket(open_time, price, price, price, price, quantity, notional, 1))
+        else:
+            bucket.high = max(bucket.high, price)
+            bucket.low = min(bucket.low, price)
+            bucket.close = price
+            bucket.volume += quantity
+            bucket.quote_volume += notional
+            bucket.trades += 1
+            self.volume += quantity
+            self.quote_volume += notional
+            self.trades += 1
+        self.last_price = price
+
+    def _append(self, bucket):
+        self.buckets.append(bucket)
+        self.volume += bucket.volume
+        self.quote_volume += bucket.quote_volume
+        self.trades += bucket.trades
+
+    def expire(self, now):
+        start = candles.open_time(now - WINDOW, BUCKET)
+        while self.buckets and self.buckets[0].open_time <= start:
+            bucket = self.buckets.popleft()
+            self.volume -= bucket.volume
+            self.quote_volume -= bucket.quote_volume
+            self.trades -= bucket.trades
+
+    def stats(self, now):
+        self.expire(now)
+        pair = pairs.pair_symbol(self.base_currency_id, self.quote_currency_id)
+        if not self.buckets:
+            last = to_decimal(self.last_price)
+            return {
+                'pair': pair, 'last': str(last) if last is not None else None,
+                'open': None, 'high': None, 'low': None, 'change': '0', 'change_percent': '0',
+                'volume': '0', 'quote_volume': '0', 'trades': 0, 'timestamp': now.isoformat(),
+            }
+        open_price = self.buckets[0].open
+        change = self.last_price - open_price
+        return {
+            'pair': pair,
+            'last': str(to_decimal(self.last_price)),
+            'open': str(to_decimal(open_price)),
+            'high': str(to_decimal(max(bucket.high for bucket in self.buckets))),
+            'low': str(to_decimal(min(bucket.low for bucket in self.buckets))),
+            'change': str(to_decimal(change)),
+            'change_percent': str(to_decimal(round_div(change * 100 * SCALE, open_price))),
+            'volume': str(to_decimal(self.volume)),
+            'quote_volume': str(to_decimal(self.quote_volume)),
+            'trades': self.trades,
+            'timestamp': now.isoformat(),
+        }
+
+
+def warm(base_currency_id, quote_currency_id):
+    """(Re)build a pair's window from its 1m candles; called when the matcher loads the pair."""
+    now = timezone.now()
+    last_price = marketdata.last_price(base_currency_id, quote_currency_id)
+    ticker = _tickers[base_currency_id, quote_currency_id] = Ticker(base_currency_id, quote_currency_id, to_units(last_price))
+    bars = Candle.objects.filter(
+        base_currency_id=base_currency_id,
+        quote_currency_id=quote_currency_id,
+        interval=BUCKET,
+        open_time__gt=candles.open_time(now - WINDOW, BUCKET),
+    ).order_by('open_time')
+    for bar in bars:
+        ticker._append(Bucket(
+            bar.open_time, to_units(bar.open), to_units(bar.high), to_units(bar.low), to_units(bar.close),
+            to_units(bar.volume), to_units(bar.quote_volume), bar.trades,
+        ))
+        ticker.last_price = to_units(bar.close)
+    return ticker
+
+
+def record(trades):
+    """Advance the windows of the trades' pairs (committed trades only) and publish them."""
+    touched = {}
+    for trade in trades:
+        key = (trade.base_currency_id, trade.quote_currency_id)
+        if key not in _tickers:
+            # The committed candles already hold this trade.
+            touched[key] = warm(*key)
+            continue
+        ticker = touched[key] = _tickers[key]
+        ticker.add(to_units(trade.price), to_units(trade.quantity), trade.traded_at)
+    publish(touched.values())
+
+
+def publish(tickers):
+    now = timezone.now()
+    stats = {ticker_key(s['pair']): s for s in (ticker.stats(now) for ticker in tickers)}
+    if not stats:
+        return
+    cache.set_many(stats, None)
+    symbols = cache.get(PAIRS_KEY) or []
+    new = [s['pair'] for s in stats.values() if s['pair'] not in symbols]
+    if new:
+        cache.set(PAIRS_KEY, sorted(symbols + new), None)
+
+
+def refresh():
+    """Republish every loaded ticker once per REFRESH_INTERVAL so a quiet pair's window keeps sliding."""
+    global _refreshed_at
+    if time.monotonic() - _refreshed_at < REFRESH_INTERVAL:
+        return
+    _refreshed_at = time.monotonic()
+    publish(list(_tickers.values()))
+
+
+def get_all():
+    """Last published 24h stats of every pair, read from the cache only."""
+    symbols = cache.get(PAIRS_KEY) or []
+    stats = cache.get_many([ticker_key(symbol) for symbol in symbols])
+    return [stats[ticker_key(symbol)] for symbol in symbols if ticker_key(symbol) in stats]
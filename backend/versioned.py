@@ -0,0 +1,49 @@
+import time
+import uuid
+
+from django.core.cache import cache
+
+from . import metrics
+
+
+class VersionedValue:
+    """
+    A value every process loads once and keeps, such as the fee schedule or
+    the pair registry. Whoever changes its source calls invalidate(), which
+    writes a new version stamp to the shared cache; the other processes
+    compare the stamp at most once per `check_interval` and reload on change.
+
+    `load` should read the primary: a replica may not have the change that
+    bumped the stamp yet, and its stale copy would then be kept.
+    """
+
+    def __init__(self, version_key, load, phase, check_interval=1.0):
+        self.version_key = version_key
+        self.load = load
+        self.phase = phase
+        self.check_interval = check_interval
+        self.value = None
+        self.version = None
+        self.checked_at = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if self.value is not None and now - self.checked_at < self.check_interval:
+            return self.value
+        self.checked_at = now
+        version = cache.get(self.version_key)
+        if self.value is not None and version == self.version:
+            return self.value
+        with metrics.phase(self.phase):
+            self.value = self.load()
+        self.version = version
+        return self.value
+
+    def reset(self):
+        """Drop this process' copy; it is reloaded on next use."""
+        self.value = None
+
+    def invalidate(self):
+        """Drop this process' copy and tell every other process to do the same."""
+        self.reset()
+        cache.set(self.version_key, uuid.uuid4().hex, None)
@@ -1,3 +1,180 @@
-from django.shortcuts import render
+import json
+from datetime import timezone
 
-# Create your views here.
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET, require_POST
+
+from . import candles, history, marketdata, metrics, orders, pairs, ticker
+from .ledger import InsufficientBalance
+
+CANDLE_LIMIT = 1000
+
+
+@require_GET
+def depth(request, pair):
+    """L2 order book for a pair such as BTC-INR, served from the matcher's snapshot."""
+    try:
+        levels = min(int(request.GET.get('levels', 20)), marketdata.DEPTH_LEVELS)
+    except ValueError:
+        return JsonResponse({'error': "'levels' must be an integer."}, status=400)
+    snapshot = marketdata.get_depth(pair.upper(), max(levels, 1))
+    if snapshot is None:
+        return JsonResponse({'error': f"No order book for {pair}."}, status=404)
+    return JsonResponse(snapshot)
+
+
+@require_GET
+def tickers(request):
+    """Rolling 24h stats of every pair, as last published by the matchers."""
+    return JsonResponse({'tickers': ticker.get_all()})
+
+
+@require_GET
+def candle_history(request, pair):
+    """OHLCV bars for a pair, e.g. /api/candles/BTC-INR/?interval=1h&start=...&end=...&limit=..."""
+    interval = request.GET.get('interval', '1m')
+    if interval not in candles.INTERVALS:
+        return JsonResponse({'error': f"'interval' must be one of {', '.join(candles.INTERVALS)}."}, status=400)
+    try:
+        start, end = (_parse_time(request.GET.get(name)) for name in ('start', 'end'))
+        limit = min(max(int(request.GET.get('limit', 500)), 1), CANDLE_LIMIT)
+    except ValueError as e:
+        return JsonResponse({'error': str(e) or "'limit' must be an integer."}, status=400)
+    ids = pairs.pair_ids(pair)
+    if ids is None:
+        return JsonResponse({'error': f"Unknown pair {pair}."}, status=404)
+    bars = candles.candle_range(*ids, interval, start=start, end=end, limit=limit)
+    return JsonResponse({
+        'pair': pair.upper(),
+        'interval': interval,
+        'candles': [
+            [bar.open_time.isoformat(), str(bar.open), str(bar.high), str(bar.low), str(bar.close),
+             str(bar.volume), str(bar.quote_volume), bar.trades]
+            for bar in bars
+        ],
+    })
+
+
+@require_POST
+def order_batch(request):
+    """
+    Cancel and place a batch of the caller's orders in one transaction:
+    {"place": [{"pair": "BTC-INR", "side": "buy", "type": "limit", "price": "100", "quantity": "1"}, ...],
+     "cancel": [order_id, ...]}
+    Both are queued for the matcher, so new orders come back pending.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Authentication required."}, status=401)
+    try:
+        body = json.loads(request.body)
+        place, cancel = body.get('place', []), body.get('cancel', [])
+        if not isinstance(place, list) or not isinstance(cancel, list):
+            raise ValueError
+        cancel = [int(order_id) for order_id in cancel]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': "Expected {\"place\": [...], \"cancel\": [ids]}."}, status=400)
+    try:
+        placed, cancelled = orders.submit_batch(request.user, place=place, cancel=cancel)
+    except (orders.InvalidOrder, InsufficientBalance) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'placed': [
+            {'id': order.id, 'status': order.status, 'locked_funds': str(order.locked_funds)}
+            for order in placed
+        ],
+        'cancelling': cancelled,
+    }, status=202)
+
+
+@require_POST
+def cancel_order(request, order_id):
+    """Cancel one of the caller's open orders."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Authentication required."}, status=401)
+    cancelled = orders.cancel(request.user, order_ids=[order_id])
+    if not cancelled:
+        return JsonResponse({'error': f"No open order {order_id}."}, status=404)
+    return JsonResponse({'cancelling': cancelled}, status=202)
+
+
+@require_POST
+def cancel_all_orders(request):
+    """Cancel all of the caller's open orders, or only those of `?pair=BTC-INR`."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Authentication required."}, status=401)
+    pair = request.GET.get('pair')
+    if pair is not None:
+        pair = pairs.pair_ids(pair)
+        if pair is None:
+            return JsonResponse({'error': f"Unknown pair {request.GET['pair']}."}, status=404)
+    return JsonResponse({'cancelling': orders.cancel(request.user, pair=pair)}, status=202)
+
+
+@require_GET
+def trade_history(request):
+    """
+    The caller's trades, newest first, a page at a time:
+    /api/trades/?pair=BTC-INR&start=...&end=...&limit=...&cursor=...
+    Pass back the returned `next` as `cursor` for the following page.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Authentication required."}, status=401)
+    try:
+        queryset = _history(request)
+        limit = min(max(int(request.GET.get('limit', 100)), 1), history.PAGE_LIMIT)
+        rows, after = history.page(queryset, after=request.GET.get('cursor'), limit=limit)
+    except ValueError as e:
+        return JsonResponse({'error': str(e) or "'limit' must be an integer."}, status=400)
+    except LookupError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    return JsonResponse({'trades': [history.as_dict(row) for row in rows], 'next': after})
+
+
+@require_GET
+def trade_export(request):
+    """The caller's whole trade history, oldest first, streamed as ?format=csv or ?format=ndjson."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Authentication required."}, status=401)
+    format = request.GET.get('format', 'csv')
+    if format not in history.FORMATS:
+        return JsonResponse({'error': f"'format' must be one of {', '.join(history.FORMATS)}."}, status=400)
+    try:
+        queryset = _history(request).reverse()
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except LookupError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    # An async iterator, so uvicorn streams it rather than buffering the whole history.
+    response = StreamingHttpResponse(history.aexport(queryset, format), content_type=history.FORMATS[format])
+    response['Content-Disposition'] = f'attachment; filename="trades.{format}"'
+    return response
+
+
+@require_GET
+def metrics_view(request):
+    """This process' matching metrics in the Prometheus text format."""
+    if not metrics.enabled:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def _history(request):
+    pair = request.GET.get('pair')
+    if pair is not None:
+        pair = pairs.pair_ids(pair)
+        if pair is None:
+            raise LookupError(f"Unknown pair {request.GET['pair']}.")
+    start, end = (_parse_time(request.GET.get(name)) for name in ('start', 'end'))
+    return history.history(request.user.id, pair=pair, start=start, end=end)
+
+
+def _parse_time(value):
+    if value is None:
+        return None
+    timestamp = parse_datetime(value)
+    if timestamp is None:
+        raise ValueError(f"Invalid timestamp '{value}', expected ISO 8601.")
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
@@ -17,6 +17,17 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from backend import views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('api/depth/<str:pair>/', views.depth, name='depth'),
+    path('api/ticker/', views.tickers, name='tickers'),
+    path('api/orders/batch/', views.order_batch, name='order-batch'),
+    path('api/orders/<int:order_id>/cancel/', views.cancel_order, name='order-cancel'),
+    path('api/orders/cancel-all/', views.cancel_all_orders, name='order-cancel-all'),
+    path('api/trades/', views.trade_history, name='trade-history'),
+    path('api/trades/export/', views.trade_export, name='trade-export'),
+    path('api/candles/<str:pair>/', views.candle_history, name='candles'),
 ]